@@ -0,0 +1,166 @@
+# benchmarks/message_storm.py
+"""
+Offline message-storm benchmark for the on_message hot path.
+
+Replays synthetic guild messages through MehdiBOT.get_context, Leveling.on_message
+and Chatbot.on_message using fake message/guild/channel objects (no gateway, no
+Discord or Gemini traffic) and reports throughput, per-handler latency and memory growth.
+
+Usage: python benchmarks/message_storm.py --guilds 50 --users 2000 --aliases 20 --messages 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# --- Fake Discord Objects ---
+class FakeUser:
+    def __init__(self, user_id: int, bot: bool = False):
+        self.id, self.bot = user_id, bot
+        self.name = self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+    def mentioned_in(self, message) -> bool:
+        return any(user.id == self.id for user in message.mentions)
+
+class FakeTyping:
+    async def __aenter__(self): return self
+    async def __aexit__(self, *exc): return False
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent, self.edits = 0, 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+    def typing(self):
+        return FakeTyping()
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channel_count: int):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.channels = [FakeChannel(guild_id * 1000 + i) for i in range(channel_count)]
+
+class FakeMessage:
+    _state = None
+
+    def __init__(self, content: str, author: FakeUser, guild: FakeGuild, channel: FakeChannel, mentions: list):
+        self.content, self.author, self.guild, self.channel = content, author, guild, channel
+        self.mentions, self.mention_everyone, self.reference = mentions, False, None
+        self.id = random.getrandbits(63)
+
+    async def reply(self, *args, **kwargs):
+        await self.channel.send(*args, **kwargs)
+        return FakeSentMessage(self.channel)
+
+    async def edit(self, **kwargs):
+        self.channel.edits += 1
+
+class FakeSentMessage(FakeMessage):
+    def __init__(self, channel: FakeChannel):
+        self.channel = channel
+
+# --- Benchmark ---
+def percentile(samples: list, pct: float) -> float:
+    if not samples: return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def build_messages(args, guilds: list, bot_user: FakeUser, prefix: str) -> list:
+    users = [FakeUser(10_000 + i) for i in range(args.users)]
+    words = ["hello", "gg", "anyone up?", "lol", "what's the plan for tonight", "nice", "brb"]
+    messages = []
+    for _ in range(args.messages):
+        guild = random.choice(guilds)
+        roll, mentions = random.random(), []
+        if roll < args.command_rate:
+            content = f"{prefix}{random.choice(['rank', 'a0', 'lb', 'unknowncmd'])}"
+        elif roll < args.command_rate + args.mention_rate:
+            content, mentions = f"<@{bot_user.id}> {random.choice(words)}", [bot_user]
+        else:
+            content = random.choice(words)
+        messages.append(FakeMessage(content, random.choice(users), guild, random.choice(guild.channels), mentions))
+    return messages
+
+async def run(args):
+    # Run inside a scratch directory so levels.db, history and log files never touch the real data
+    workdir = tempfile.mkdtemp(prefix="message_storm_")
+    os.chdir(workdir)
+    random.seed(args.seed)
+
+    import bot as bot_module
+    from utils.gemini import GeminiService, FakeBackend
+    from cogs.leveling import Leveling
+    from cogs.chatbot import Chatbot
+
+    guilds = [FakeGuild(1_000_000 + g, args.channels) for g in range(args.guilds)]
+    async with bot_module.bot as bot: # Same setup as bot.main(), minus logging in
+        # Canned Gemini replies, with limits high enough that they never throttle the replay
+        bot.gemini = GeminiService(FakeBackend("This is a canned benchmark reply."), rate=1e9, burst=10**9, max_concurrent=10**6)
+        await replay(args, bot, guilds, Leveling, Chatbot)
+
+async def replay(args, bot, guilds: list, Leveling, Chatbot):
+    bot.aliases_cache = {str(guild.id): {f"a{i}": "rank" for i in range(args.aliases)} for guild in guilds}
+    bot_user = FakeUser(1, bot=True)
+    bot._connection.user = bot_user
+
+    leveling, chatbot = Leveling(bot), Chatbot(bot)
+    handlers = {
+        "get_context": bot.get_context,
+        "Leveling.on_message": leveling.on_message,
+        "Chatbot.on_message": chatbot.on_message,
+    }
+    messages = build_messages(args, guilds, bot_user, bot.command_prefix)
+    latencies = {name: [] for name in handlers}
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for message in messages:
+        for name, handler in handlers.items():
+            t0 = time.perf_counter()
+            await handler(message)
+            latencies[name].append(time.perf_counter() - t0)
+    # Chatbot turns run on the scheduler's background workers; let them finish
+    while chatbot.scheduler.workers:
+        await asyncio.gather(*chatbot.scheduler.workers.values())
+    elapsed = time.perf_counter() - started
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    await leveling.cog_unload()
+
+    print(f"Messages: {len(messages)}  Guilds: {args.guilds}  Users: {args.users}  Aliases/guild: {args.aliases}")
+    print(f"Throughput: {len(messages) / elapsed:,.0f} messages/sec ({elapsed:.2f}s total)")
+    print(f"{'Handler':<22}{'p50 (µs)':>12}{'p99 (µs)':>12}{'max (µs)':>12}")
+    for name, samples in latencies.items():
+        print(f"{name:<22}{percentile(samples, 50) * 1e6:>12.1f}{percentile(samples, 99) * 1e6:>12.1f}{max(samples) * 1e6:>12.1f}")
+    ttfb = list(chatbot.first_byte_latencies)
+    if ttfb:
+        print(f"Chatbot time-to-first-byte: p50 {percentile(ttfb, 50) * 1e6:.1f}µs, p99 {percentile(ttfb, 99) * 1e6:.1f}µs (last {len(ttfb)} streamed replies)")
+    print(f"Memory growth: {(memory_after - memory_before) / 1024:,.1f} KiB (peak {memory_peak / 1024:,.1f} KiB)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays synthetic messages through the bot's on_message handlers.")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=5, help="Text channels per guild")
+    parser.add_argument("--aliases", type=int, default=10, help="Aliases per guild")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--command-rate", type=float, default=0.05, help="Fraction of messages that use the prefix")
+    parser.add_argument("--mention-rate", type=float, default=0.01, help="Fraction of messages that ping the bot")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
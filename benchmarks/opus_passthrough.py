@@ -0,0 +1,79 @@
+# benchmarks/opus_passthrough.py
+"""
+Measures CPU per concurrent music stream for the transcoding and Opus passthrough paths.
+
+Encodes a test tone to Opus/WebM (like YouTube's bestaudio), then plays it through the
+music cog's sources on one thread per stream, as discord.py's audio players do, reading
+frames as fast as possible. The transcoding path also Opus-encodes every frame when
+libopus is available, as discord.py does before sending. Reports CPU seconds (Python
+plus FFmpeg) per minute of audio per stream.
+
+Usage: python benchmarks/opus_passthrough.py --streams 8 --seconds 120
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def cpu_seconds() -> float:
+    """User + system CPU of this process and its finished children (the FFmpeg processes)."""
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def drain(source, encoder):
+    while data := source.read():
+        if encoder is not None and not source.is_opus():
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+    source.cleanup() # Waits for FFmpeg, so its CPU time is counted
+
+def measure(sources: list, with_encoder: bool) -> float:
+    import discord
+    started = cpu_seconds()
+    threads = [threading.Thread(target=drain, args=(source, discord.opus.Encoder() if with_encoder else None)) for source in sources]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return cpu_seconds() - started
+
+async def build(path: str, count: int, volume: float) -> list:
+    from cogs.music import Track, YTDLSource
+    track = Track({"title": "test tone", "webpage_url": path, "url": path, "expires": time.time() + 3600, "acodec": "opus"})
+    return [await YTDLSource.from_track(track, volume=volume) for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares CPU per stream for transcoded and passthrough playback.")
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--seconds", type=int, default=120, help="Length of the test track")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="opus_passthrough_"))
+    import discord
+    from cogs import music
+    path = os.path.abspath("tone.webm")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={args.seconds}",
+                    "-ac", "2", "-ar", "48000", "-c:a", "libopus", "-b:a", "128k", path], check=True)
+    with_encoder = discord.opus.is_loaded() or discord.opus._load_default()
+    if not with_encoder:
+        print("libopus is not loaded: the transcoding figures leave out discord.py's Opus encode, so they understate its cost.")
+
+    minutes = args.streams * args.seconds / 60
+    results = {}
+    for label, volume in (("Transcoding (volume 50%)", 0.5), ("Opus passthrough (volume 100%)", 1.0)):
+        sources = asyncio.run(build(path, args.streams, volume))
+        results[label] = measure(sources, with_encoder) / minutes
+    music.extraction_pool.shutdown()
+
+    print(f"Streams: {args.streams}  Track: {args.seconds}s")
+    print(f"{'Path':<34}{'CPU s per audio minute per stream':>36}")
+    for label, per_minute in results.items():
+        print(f"{label:<34}{per_minute:>36.3f}")
+
+if __name__ == "__main__":
+    main()
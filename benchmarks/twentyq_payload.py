@@ -0,0 +1,105 @@
+# benchmarks/twentyq_payload.py
+"""
+Measures the prompt bytes sent per 20 Questions turn.
+
+Plays a full game offline (fake channel, fake button clicks, FakeBackend standing in for
+Gemini) and prints the size of each request next to what the old full-history format
+would have sent. Compact requests should stop growing once the older answers fill the
+summary budget, and stay within about one question's length of each other from then on.
+
+Usage: python benchmarks/twentyq_payload.py --questions 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+class FakeTyping:
+    async def __aenter__(self): return self
+    async def __aexit__(self, *exc): return False
+
+class FakeMessage:
+    def __init__(self, message_id: int):
+        self.id = message_id
+
+class FakeChannel:
+    id = 1
+    def __init__(self):
+        self.sent = 0
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage(self.sent)
+
+class FakeInteractionResponse:
+    async def edit_message(self, **kwargs): pass
+    async def send_message(self, *args, **kwargs): pass
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+class FakeInteraction:
+    def __init__(self, channel: FakeChannel, message_id: int, user_id: int):
+        self.channel, self.channel_id = channel, channel.id
+        self.message, self.user = FakeMessage(message_id), FakeUser(user_id)
+        self.response = FakeInteractionResponse()
+
+class FakeBot:
+    def __init__(self, gemini):
+        self.gemini = gemini
+
+def legacy_request_size(questions: int, pairs: list) -> int:
+    """What the pre-compact format sent: the full initial prompt plus every question and answer as separate turns."""
+    initial_prompt = (
+        f"Let's play a game where you try to guess an object I'm thinking of. You have {questions} questions. "
+        f"You MUST ask all questions and make all guesses strictly in the English language. "
+        f"Your response MUST ONLY contain the question itself, with no other text, translation, or transliteration. "
+        f"Start with your first question now."
+    )
+    return len(initial_prompt.encode()) + sum(len(q.encode()) + len(f"The answer is: {a}".encode()) for q, a in pairs)
+
+async def run(args):
+    os.chdir(tempfile.mkdtemp(prefix="twentyq_payload_"))
+    random.seed(args.seed)
+    from cogs.twentyquestions import TwentyQuestions, GameState
+    from utils.gemini import GeminiService, FakeBackend
+
+    def reply(contents):
+        if "final guess" in contents[-1]['parts'][0]: return "A teapot"
+        return f"Is it something you would find in a {random.choice(['kitchen', 'garden', 'office'])}?"
+
+    backend = FakeBackend(reply)
+    cog = TwentyQuestions(FakeBot(GeminiService(backend, rate=1e9, burst=10**9)))
+    channel, author_id = FakeChannel(), 42
+    game = GameState(channel.id, author_id, "player", "en", args.questions)
+    cog.games[channel.id] = game
+
+    await cog.ask_next_question(channel, game)
+    while game.phase == "awaiting":
+        await cog.handle_answer(FakeInteraction(channel, game.message_id, author_id), random.choice(["Yes", "No", "Maybe or sometimes"]))
+    cog.store.close()
+
+    print(f"{'Turn':>5}{'Compact (bytes)':>18}{'Full history (bytes)':>22}")
+    for asked, size in cog.request_sizes:
+        print(f"{asked:>5}{size:>18}{legacy_request_size(args.questions, [p for p in game.answers[:asked] if p[1]]):>22}")
+    later = [size for asked, size in cog.request_sizes if asked >= args.questions // 2]
+    if later:
+        print(f"Compact requests in the second half of the game: {min(later)}-{max(later)} bytes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints prompt bytes per 20 Questions turn.")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
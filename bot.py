@@ -7,6 +7,9 @@ import logging
 from itertools import cycle
 from config import PREFIX, OWNER_ID # <-- TOKEN is no longer imported
 import json
+from utils.resolver import UserResolver
+from utils import ytdl_pool
+from utils.gemini import GeminiService, default_backend
 
 # --- Alias File Management ---
 ALIAS_FILE = "aliases.json"
@@ -22,6 +25,8 @@ class MehdiBOT(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.aliases_cache = load_aliases()
+        self.user_resolver = UserResolver(self)
+        self.gemini = GeminiService(default_backend())
 
     def reload_aliases(self):
         self.aliases_cache = load_aliases()
@@ -108,6 +113,9 @@ async def on_command_error(ctx: commands.Context, error):
         await ctx.reply(f"An unexpected error occurred.")
 
 async def main():
+    # Fork the yt-dlp workers while the bot is still single-threaded, before any cog starts threads
+    if not ytdl_pool.start():
+        logger.info("yt-dlp extraction will run in threads.")
     async with bot:
         for filename in os.listdir('./cogs'):
             if filename.endswith('.py') and filename != '__init__.py':
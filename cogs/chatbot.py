@@ -1,54 +1,341 @@
 # cogs/chatbot.py
 import discord
-from discord.ext import commands
-from config import GEMINI_API_KEY
-import google.generativeai as genai
+from discord.ext import commands, tasks
 import io
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict, deque
 import json # New import for file handling
 import os   # New import for file path checking
+from concurrent.futures import ThreadPoolExecutor
 
-# --- NEW: History File Management ---
-HISTORY_FILE = "conversation_history.json"
+# --- Conversation History ---
+HISTORY_TOKEN_BUDGET = 4000 # Approximate tokens of history sent with each request
+HISTORY_MAX_ENTRIES = 40    # Hard cap on entries per channel, however small they are
+SUMMARIZE_TRIMMED = False   # Fold trimmed turns into one compact summary turn in the background
 
-def load_history():
-    """Loads the conversation history from a JSON file."""
-    if os.path.exists(HISTORY_FILE):
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token). Computed once per entry when the turn is recorded."""
+    return max(1, len(text) // 4)
+
+class ConversationHistory:
+    """One channel's recent entries, each with its token count cached next to it, plus an optional summary of older turns."""
+    __slots__ = ("entries", "tokens", "total", "summary")
+
+    def __init__(self):
+        self.entries, self.tokens, self.total, self.summary = [], [], 0, None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add_turn(self, entries: list, tokens: list = None):
+        tokens = tokens or [estimate_tokens(" ".join(map(str, entry['parts']))) for entry in entries]
+        self.entries.extend(entries)
+        self.tokens.extend(tokens)
+        self.total += sum(tokens)
+
+    def trim(self, budget: int = HISTORY_TOKEN_BUDGET, max_entries: int = HISTORY_MAX_ENTRIES) -> list:
+        """Drops the oldest turns until the history fits the budget. Returns the dropped entries."""
+        dropped = []
+        while self.entries and (self.total > budget or len(self.entries) > max_entries):
+            # Drop a whole user/model pair so the history still starts with a user turn
+            n = min(2, len(self.entries))
+            dropped.extend(self.entries[:n])
+            self.total -= sum(self.tokens[:n])
+            del self.entries[:n], self.tokens[:n]
+        return dropped
+
+    def contents(self) -> list:
+        """The history as sent to the model, with the summary (if any) as a leading turn."""
+        if not self.summary:
+            return list(self.entries)
+        return [{'role': 'user', 'parts': [f"Summary of our earlier conversation: {self.summary}"]},
+                {'role': 'model', 'parts': ["Got it, I'll keep that in mind."]}] + self.entries
+
+    def apply_record(self, record):
+        """Applies one journal record. Plain lists are records from before token counts were stored."""
+        if isinstance(record, list):
+            return self.add_turn(record)
+        if record.get("reset"):
+            self.__init__()
+        if "entries" in record:
+            self.add_turn(record["entries"], record.get("tokens"))
+        if "summary" in record:
+            self.summary = record["summary"]
+
+    def snapshot(self) -> dict:
+        return {"reset": True, "entries": list(self.entries), "tokens": list(self.tokens), "summary": self.summary}
+
+# --- History Journal ---
+HISTORY_FILE = "conversation_history.json" # Legacy single-file format, migrated once into the journal
+HISTORY_DIR = "conversation_history"
+COMPACT_AFTER = 50  # Journal records per channel before it is compacted
+
+class HistoryJournal:
+    """
+    Append-only conversation storage: one `<channel_id>.jsonl` file per channel with one
+    JSON record per turn. Appends and compactions run in order on a single background
+    thread. A torn write can only damage the last line of its own channel's file, and
+    loading skips it.
+    """
+
+    def __init__(self, path: str = HISTORY_DIR, compact_after: int = COMPACT_AFTER):
+        self.path, self.compact_after = path, compact_after
+        self.record_counts = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-journal")
+
+    def _channel_file(self, channel_id: int) -> str:
+        return os.path.join(self.path, f"{channel_id}.jsonl")
+
+    def _migrate_legacy(self):
+        os.makedirs(self.path)
+        if not os.path.exists(HISTORY_FILE): return
         with open(HISTORY_FILE, 'r') as f:
             try:
-                # JSON keys must be strings, so convert channel IDs back to integers on load
-                return {int(k): v for k, v in json.load(f).items()}
-            except (json.JSONDecodeError, ValueError):
-                return {} # Return empty dictionary if file is corrupted or empty
-    return {}
+                legacy = json.load(f)
+            except json.JSONDecodeError:
+                return
+        for channel_id, entries in legacy.items():
+            if isinstance(entries, list):
+                history = ConversationHistory()
+                history.add_turn(entries)
+                history.trim()
+                self._rewrite(int(channel_id), history.snapshot())
+
+    def read_channel(self, channel_id: int) -> tuple[ConversationHistory, int, bool]:
+        """Returns (the trimmed history, record count, whether a damaged record was skipped)."""
+        history, records, damaged = ConversationHistory(), 0, False
+        try:
+            with open(self._channel_file(channel_id), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        history.apply_record(json.loads(line))
+                        records += 1
+                    except (json.JSONDecodeError, TypeError, KeyError, AttributeError):
+                        damaged = True
+        except FileNotFoundError:
+            pass
+        history.trim()
+        return history, records, damaged
+
+    def prepare(self):
+        """Creates the journal directory, migrating the legacy JSON file the first time."""
+        if not os.path.isdir(self.path):
+            self._migrate_legacy()
+
+    def load_channel(self, channel_id: int) -> ConversationHistory:
+        """Rebuilds one channel's history from its journal file. Blocking; run it on the journal's executor."""
+        history, records, damaged = self.read_channel(channel_id)
+        if damaged or records > self.compact_after:
+            # Rewrite now so later appends never land after a torn line
+            self._rewrite(channel_id, history.snapshot())
+            records = 1
+        self.record_counts[channel_id] = records
+        return history
+
+    def forget(self, channel_id: int):
+        self.record_counts.pop(channel_id, None)
+
+    def _append(self, channel_id: int, record: dict):
+        with open(self._channel_file(channel_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _rewrite(self, channel_id: int, record: dict):
+        target = self._channel_file(channel_id)
+        with open(target + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(target + ".tmp", target)
+
+    def append(self, channel_id: int, record: dict, history: ConversationHistory):
+        """Queues one record for writing, plus a compaction down to `history` once the journal grows too long."""
+        self.executor.submit(self._append, channel_id, record).add_done_callback(self._report_error)
+        self.record_counts[channel_id] = self.record_counts.get(channel_id, 0) + 1
+        if self.record_counts[channel_id] > self.compact_after:
+            self.executor.submit(self._rewrite, channel_id, history.snapshot()).add_done_callback(self._report_error)
+            self.record_counts[channel_id] = 1
+
+    @staticmethod
+    def _report_error(future):
+        if future.exception():
+            print(f"Failed to write conversation history: {future.exception()}")
+
+    def close(self):
+        """Waits for queued writes to finish."""
+        self.executor.shutdown(wait=True)
+
+
+# --- Resident Histories ---
+HISTORY_RESIDENT = 500   # Channels whose history is kept in memory
+HISTORY_IDLE_TTL = 3600  # Seconds without a turn before a channel's history is evicted
+
+class HistoryCache:
+    """
+    Loads channel histories from the journal on first use and keeps the most recently
+    used ones in a bounded LRU. Evicting is free since every turn is already journaled.
+    Loads go through the journal's executor, so they always see earlier queued writes.
+    """
+
+    def __init__(self, journal: HistoryJournal, max_resident: int = HISTORY_RESIDENT, idle_ttl: float = HISTORY_IDLE_TTL):
+        self.journal, self.max_resident, self.idle_ttl = journal, max_resident, idle_ttl
+        self.resident = OrderedDict() # channel_id -> [history, last_used], least recently used first
+        self.loading = {}             # channel_id -> pending load future
+        self.loads, self.evictions = 0, 0
+
+    def __len__(self) -> int:
+        return len(self.resident)
+
+    async def get(self, channel_id: int) -> ConversationHistory:
+        entry = self.resident.get(channel_id)
+        if entry is None:
+            if channel_id not in self.loading:
+                self.loading[channel_id] = asyncio.get_running_loop().run_in_executor(self.journal.executor, self.journal.load_channel, channel_id)
+                self.loads += 1
+            pending = self.loading[channel_id]
+            try:
+                history = await pending
+            finally:
+                if self.loading.get(channel_id) is pending: del self.loading[channel_id] # A failed load is retried next time
+            entry = self.resident.setdefault(channel_id, [history, 0.0])
+        entry[1] = time.monotonic()
+        self.resident.move_to_end(channel_id)
+        while len(self.resident) > self.max_resident:
+            self._evict(next(iter(self.resident)))
+        return entry[0]
 
-def save_history(history_data):
-    """Saves the entire conversation history to a JSON file."""
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(history_data, f, indent=4)
+    def sweep(self):
+        """Evicts channels that have been idle for longer than `idle_ttl`."""
+        cutoff = time.monotonic() - self.idle_ttl
+        while self.resident and next(iter(self.resident.values()))[1] < cutoff:
+            self._evict(next(iter(self.resident)))
 
+    def _evict(self, channel_id: int):
+        del self.resident[channel_id]
+        self.journal.forget(channel_id)
+        self.evictions += 1
+
+# --- Request Scheduling ---
+MAX_CONCURRENT_REQUESTS = 4  # Gemini calls in flight across all channels
+MAX_QUEUED_PER_CHANNEL = 5   # Waiting messages per channel before replying "busy"
+MAX_QUEUED_TOTAL = 50        # Waiting messages across all channels before replying "busy"
+
+class ChatScheduler:
+    """
+    Serializes chatbot turns per channel and caps concurrent Gemini calls globally.
+    Messages that pile up in a channel while a turn is running are handed to the
+    handler together, as one batch, on the next turn.
+    """
+
+    def __init__(self, handler, max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 max_per_channel: int = MAX_QUEUED_PER_CHANNEL, max_total: int = MAX_QUEUED_TOTAL):
+        self.handler = handler
+        self.max_per_channel, self.max_total = max_per_channel, max_total
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.queues = {}  # channel_id -> [(message, prompt), ...]
+        self.workers = {} # channel_id -> task draining that channel's queue
+        self.queued, self.rejected, self.coalesced = 0, 0, 0
+
+    def submit(self, message: discord.Message, prompt: str) -> bool:
+        """Queues a prompt for its channel. Returns False if the queues are full."""
+        channel_id = message.channel.id
+        queue = self.queues.setdefault(channel_id, [])
+        if len(queue) >= self.max_per_channel or self.queued >= self.max_total:
+            self.rejected += 1
+            return False
+        queue.append((message, prompt))
+        self.queued += 1
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+        return True
+
+    async def _drain(self, channel_id: int):
+        try:
+            while self.queues.get(channel_id):
+                batch = self.queues.pop(channel_id)
+                self.queued -= len(batch)
+                self.coalesced += len(batch) - 1
+                async with self.semaphore:
+                    try:
+                        await self.handler(batch)
+                    except Exception as e:
+                        print(f"Chatbot turn failed in channel {channel_id}: {e}")
+        finally:
+            self.workers.pop(channel_id, None)
+
+    def cancel_all(self):
+        for worker in self.workers.values():
+            worker.cancel()
+        self.queues.clear()
+        self.queued = 0
+
+# --- Response Cache ---
+CACHE_SIZE = 256        # Cached responses
+CACHE_TTL = 1800        # Seconds a cached response stays valid
+CACHE_MAX_HISTORY = 2   # Channels with more history entries than this skip the cache
+
+class ResponseCache:
+    """An LRU + TTL cache of model replies, keyed on the normalized prompt and a hash of the history sent with it."""
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_size, self.ttl = max_size, ttl
+        self.entries = OrderedDict() # key -> (expires_at, text)
+        self.hits, self.misses = 0, 0
+
+    @staticmethod
+    def make_key(prompt: str, history: list) -> tuple:
+        normalized = re.sub(r"\s+", " ", prompt.lower()).strip(" ?!.")
+        history_hash = hashlib.sha1(json.dumps(history, sort_keys=True).encode()).hexdigest()
+        return normalized, history_hash
+
+    def get(self, key: tuple) -> str | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry: del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, text: str):
+        self.entries[key] = (time.monotonic() + self.ttl, text)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+# --- Streaming ---
+STREAM_REPLIES = True        # Post the reply as it is generated instead of waiting for the full text
+STREAM_EDIT_INTERVAL = 1.5   # Minimum seconds between edits, to stay inside Discord's edit rate limits
 
 class Chatbot(commands.Cog):
     """
-    A conversational AI agent powered by Google Gemini with persistent conversation memory.
+    A conversational AI agent powered by Google Gemini (through `bot.gemini`) with persistent conversation memory.
     """
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        # --- UPDATED: Load history from file on startup ---
-        self.conversation_histories = load_history()
-        
-        # Configure the Gemini API client
-        try:
-            if GEMINI_API_KEY and GEMINI_API_KEY != "YOUR_GEMINI_API_KEY_HERE":
-                genai.configure(api_key=GEMINI_API_KEY)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                print("Chatbot cog configured successfully with Gemini.")
-            else:
-                print("Gemini API key not found. Chatbot features will be disabled.")
-                self.model = None
-        except Exception as e:
-            print(f"Failed to configure Gemini text model: {e}")
-            self.model = None
+        # --- UPDATED: Histories are loaded from the journal per channel, on first use ---
+        self.journal = HistoryJournal()
+        self.journal.prepare()
+        self.histories = HistoryCache(self.journal)
+        self.sweep_histories.start()
+        self.scheduler = ChatScheduler(self.respond)
+        self.response_cache = ResponseCache()
+        self.first_byte_latencies = deque(maxlen=200) # Seconds from request to first visible reply text
+        self.gemini = bot.gemini
+        self.summaries = set() # Summarize tasks in flight, referenced so they are not garbage-collected
+
+    async def cog_unload(self):
+        self.sweep_histories.cancel()
+        self.scheduler.cancel_all()
+        self.journal.close()
+
+    @tasks.loop(minutes=5)
+    async def sweep_histories(self):
+        self.histories.sweep()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -67,8 +354,8 @@ class Chatbot(commands.Cog):
         if not is_ping and not is_reply_to_bot and not contains_name:
             return
 
-        if not self.model:
-            print("Chatbot listener triggered, but Gemini model is not configured.")
+        if not self.gemini.available:
+            print("Chatbot listener triggered, but Gemini is not configured.")
             return
 
         if is_ping:
@@ -79,29 +366,107 @@ class Chatbot(commands.Cog):
         if not prompt:
             return await message.reply("You mentioned me! How can I help you today?")
 
-        channel_id = message.channel.id
-        history = self.conversation_histories.setdefault(channel_id, [])
+        if not self.scheduler.submit(message, prompt):
+            await message.reply("⏳ I'm busy answering other messages right now, please try again in a moment.")
 
-        async with message.channel.typing():
-            try:
-                full_prompt = history + [{'role': 'user', 'parts': [prompt]}]
-                response = await self.model.generate_content_async(full_prompt)
-                
-                history.append({'role': 'user', 'parts': [prompt]})
-                history.append({'role': 'model', 'parts': [response.text]})
+    async def respond(self, batch: list):
+        """Answers one turn for a channel. Several queued messages are combined into a single prompt."""
+        message = batch[-1][0]
+        if len(batch) == 1:
+            prompt = batch[0][1]
+        else:
+            prompt = "\n".join(f"{queued.author.display_name}: {text}" for queued, text in batch)
 
-                if len(history) > 10:
-                    self.conversation_histories[channel_id] = history[-10:]
+        channel_id = message.channel.id
+        history = await self.histories.get(channel_id)
+        contents = history.contents()
 
-                # --- NEW: Save the updated history to the file ---
-                save_history(self.conversation_histories)
+        # Short, fresh conversations are the ones that repeat; long ones skip the cache
+        cache_key = ResponseCache.make_key(prompt, contents) if len(contents) <= CACHE_MAX_HISTORY else None
+        text = self.response_cache.get(cache_key) if cache_key else None
 
-                if len(response.text) > 2000:
-                    await message.reply("The response was too long, so I've sent it as a file.", file=discord.File(io.StringIO(response.text), "response.txt"))
+        replied = False
+        try:
+            if text is None:
+                full_prompt = contents + [{'role': 'user', 'parts': [prompt]}]
+                if STREAM_REPLIES:
+                    text, replied = await self.stream_reply(message, full_prompt), True
                 else:
-                    await message.reply(response.text)
-            except Exception as e:
-                await message.reply(f"❌ An error occurred with the Gemini API: `{e}`")
+                    async with message.channel.typing():
+                        response = await self.gemini.generate(full_prompt, cog="Chatbot")
+                        text = response.text
+                if cache_key: self.response_cache.put(cache_key, text)
+
+            turn = [{'role': 'user', 'parts': [prompt]}, {'role': 'model', 'parts': [text]}]
+            tokens = [estimate_tokens(prompt), estimate_tokens(text)]
+            history.add_turn(turn, tokens)
+            dropped = history.trim()
+
+            # --- NEW: Journal the turn in the background ---
+            self.journal.append(channel_id, {"entries": turn, "tokens": tokens}, history)
+            if dropped and SUMMARIZE_TRIMMED:
+                task = asyncio.create_task(self.summarize(channel_id, history, dropped))
+                self.summaries.add(task)
+                task.add_done_callback(self.summaries.discard)
+
+            if replied:
+                return
+            if len(text) > 2000:
+                await message.reply("The response was too long, so I've sent it as a file.", file=discord.File(io.StringIO(text), "response.txt"))
+            else:
+                await message.reply(text)
+        except Exception as e:
+            await message.reply(f"❌ An error occurred with the Gemini API: `{e}`")
+
+    async def summarize(self, channel_id: int, history: ConversationHistory, dropped: list):
+        """Folds trimmed turns into the channel's running summary so older context survives in a few tokens."""
+        transcript = "\n".join(f"{entry['role']}: {' '.join(map(str, entry['parts']))}" for entry in dropped)
+        request = (
+            f"Previous summary: {history.summary or 'None'}\n\nConversation:\n{transcript}\n\n"
+            "Rewrite the previous summary to also cover this conversation, in at most 5 short sentences."
+        )
+        try:
+            response = await self.gemini.generate(request, cog="Chatbot")
+            history.summary = response.text.strip()
+            self.journal.append(channel_id, {"summary": history.summary}, history)
+        except Exception as e:
+            print(f"Failed to summarize history for channel {channel_id}: {e}")
+
+    async def stream_reply(self, message: discord.Message, full_prompt: list) -> str:
+        """
+        Streams a response into a reply: the first chunk is posted as soon as it arrives and the
+        message is then edited at most every STREAM_EDIT_INTERVAL seconds. Past 2000 characters
+        the reply switches to the response.txt file fallback. Returns the full text.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await self.gemini.generate(full_prompt, cog="Chatbot", stream=True)
+        text, shown, reply, last_edit = "", "", None, 0.0
+        async for chunk in response:
+            try:
+                text += chunk.text
+            except ValueError:
+                continue # Chunks without text parts (e.g. safety metadata only)
+            if len(text) > 2000 or not text.strip():
+                continue
+            now = loop.time()
+            if reply is None:
+                reply = await message.reply(text)
+                self.first_byte_latencies.append(now - started)
+                shown, last_edit = text, now
+            elif now - last_edit >= STREAM_EDIT_INTERVAL:
+                await reply.edit(content=text)
+                shown, last_edit = text, now
+
+        if len(text) > 2000:
+            too_long, file = "The response was too long, so I've sent it as a file.", discord.File(io.StringIO(text), "response.txt")
+            if reply: await reply.edit(content=too_long, attachments=[file])
+            else: await message.reply(too_long, file=file)
+        elif reply is None:
+            await message.reply(text or "…")
+        elif shown != text:
+            await reply.edit(content=text)
+        return text
 
 async def setup(bot: commands.Bot):
     """Adds the cog to the bot."""
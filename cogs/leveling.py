@@ -1,46 +1,500 @@
 # cogs/leveling.py
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import json
 import os
 import random
 import asyncio
-from collections import defaultdict
+import sqlite3
+from contextlib import closing
+from collections import defaultdict, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Only needed by the bulk `levels` admin commands
 
 # --- Data Management ---
-LEVELS_FILE = "levels.json"
+LEVELS_FILE = "levels.json"   # Legacy store, imported once into the database
+LEVELS_DB = "levels.db"
+FLUSH_INTERVAL = 30           # Seconds between write-behind flushes
+LEADERBOARD_PAGE_SIZE = 10
+XP_COOLDOWN = 60              # Seconds between XP awards for the same member
+LEVELUP_WINDOW = 3.0          # Seconds level-up announcements are batched per channel
+LEVELUP_MAX_BATCH = 15        # Announcements per combined message
 
-def load_levels():
-    """Loads level data from a file, ensuring nested dictionaries."""
-    if os.path.exists(LEVELS_FILE):
-        with open(LEVELS_FILE, 'r') as f:
-            try:
-                # Load the data and ensure each guild's data is a defaultdict
-                data = json.load(f)
-                return defaultdict(lambda: defaultdict(lambda: {"xp": 0, "level": 1}), 
-                                   {gid: defaultdict(lambda: {"xp": 0, "level": 1}, udata) for gid, udata in data.items()})
-            except json.JSONDecodeError:
-                pass # Fallback to new defaultdict if file is empty/corrupt
-    # If file doesn't exist or is invalid, create a new nested defaultdict structure
+def new_levels_data():
+    """Creates the nested guild -> user -> {"xp", "level"} structure."""
     return defaultdict(lambda: defaultdict(lambda: {"xp": 0, "level": 1}))
 
-def save_levels(levels_data):
-    """Saves level data to a file."""
-    with open(LEVELS_FILE, 'w') as f:
-        # Convert defaultdicts to regular dicts for clean JSON saving
-        json.dump({k: dict(v) for k, v in levels_data.items()}, f, indent=4)
+class LevelStore:
+    """SQLite (WAL) storage for XP, one row per (guild, user), written in batches."""
+    def __init__(self, path: str = LEVELS_DB):
+        self.path = path
+        self.dirty = set()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS levels (guild_id TEXT NOT NULL, user_id TEXT NOT NULL, "
+                         "xp INTEGER NOT NULL DEFAULT 0, level INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (guild_id, user_id))")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def import_json(self, json_path: str = LEVELS_FILE) -> int:
+        """One-time import of the legacy levels.json. Returns the number of rows imported."""
+        with closing(self._connect()) as conn, conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+                return 0
+            rows = []
+            if os.path.exists(json_path):
+                with open(json_path, 'r') as f:
+                    try:
+                        data = json.load(f)
+                    except json.JSONDecodeError:
+                        data = {}
+                for gid, users in data.items():
+                    for uid, udata in users.items():
+                        # Skip malformed entries instead of failing the whole import
+                        if isinstance(udata, dict) and 'xp' in udata:
+                            rows.append((str(gid), str(uid), int(udata.get('xp', 0)), int(udata.get('level', 1))))
+            conn.executemany("INSERT OR IGNORE INTO levels (guild_id, user_id, xp, level) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_imported', ?)", (json_path,))
+            return len(rows)
+
+    def load(self):
+        """Loads every row into the in-memory nested defaultdict."""
+        levels_data = new_levels_data()
+        with closing(self._connect()) as conn:
+            for gid, uid, xp, level in conn.execute("SELECT guild_id, user_id, xp, level FROM levels"):
+                levels_data[gid][uid] = {"xp": xp, "level": level}
+        return levels_data
+
+    def get_meta(self, key: str, default: str = None) -> str | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+
+    def mark_dirty(self, guild_id: str, user_id: str):
+        self.dirty.add((guild_id, user_id))
+
+    def take_batch(self, levels_data) -> list:
+        """Snapshots the dirty rows on the event loop so the write can happen in a thread."""
+        batch, self.dirty = self.dirty, set()
+        return [(gid, uid, levels_data[gid][uid]["xp"], levels_data[gid][uid]["level"]) for gid, uid in batch]
+
+    def write_batch(self, rows: list):
+        """Upserts a batch of rows in a single transaction. Blocking; run it in an executor."""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT INTO levels (guild_id, user_id, xp, level) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = excluded.xp, level = excluded.level", rows)
+
+# --- Level Curve ---
+class LevelCurve:
+    """The XP curve: leaving level L requires a*L² + b*L + c total XP."""
+    __slots__ = ("a", "b", "c")
+
+    def __init__(self, a: int = 5, b: int = 50, c: int = 100):
+        if a <= 0 or b < 0 or c < 0:
+            raise ValueError("The curve needs a > 0 and non-negative b and c.")
+        self.a, self.b, self.c = a, b, c
+
+    def __str__(self) -> str:
+        return f"{self.a}L² + {self.b}L + {self.c}"
+
+    def dumps(self) -> str:
+        return json.dumps([self.a, self.b, self.c])
+
+    @classmethod
+    def loads(cls, raw: str | None) -> "LevelCurve":
+        return cls(*json.loads(raw)) if raw else cls()
+
+    def xp_for_level(self, level: int) -> int:
+        """Calculates the total XP needed to reach a certain level."""
+        if level <= 0: return 0
+        return self.a * (level**2) + (self.b * level) + self.c
+
+    def levels_for_xp(self, xp):
+        """
+        Vectorized inverse of the curve: the level for every XP value in an array.
+        A member is level L while xp_for_level(L - 1) <= xp < xp_for_level(L), so the
+        level is 1 + the largest k with a*k² + b*k + c <= xp (solved with the quadratic formula).
+        """
+        xp = np.asarray(xp, dtype=np.int64)
+        discriminant = np.maximum(self.b**2 - 4 * self.a * (self.c - xp.astype(np.float64)), 0)
+        k = np.maximum(np.floor((np.sqrt(discriminant) - self.b) / (2 * self.a)), 0).astype(np.int64)
+        # Correct any off-by-one from floating point rounding near exact thresholds
+        k += self._thresholds(k + 1) <= xp
+        k -= (k > 0) & (self._thresholds(k) > xp)
+        return k + 1
+
+    def _thresholds(self, k):
+        return self.a * k * k + self.b * k + self.c
+
+def recompute_levels(levels_data, curve: LevelCurve, xp_updates: dict = None, add: bool = False) -> list:
+    """
+    Recomputes every member's level in one pass, one NumPy array per guild.
+    `xp_updates` maps guild_id -> {user_id: xp} to import, replacing (or with `add`, adding to) their XP.
+    Returns (guild_id, user_id, old_xp, new_xp, old_level, new_level) for every member that changes;
+    nothing is modified, so the result doubles as a dry-run diff.
+    """
+    xp_updates = xp_updates or {}
+    changes = []
+    for guild_id in set(levels_data) | set(xp_updates):
+        users = levels_data.get(guild_id, {})
+        imported = xp_updates.get(guild_id, {})
+        user_ids = list(dict.fromkeys([*users, *imported]))
+        if not user_ids: continue
+        old_xp = np.fromiter((users[uid]["xp"] if uid in users else 0 for uid in user_ids), dtype=np.int64, count=len(user_ids))
+        old_level = np.fromiter((users[uid]["level"] if uid in users else 1 for uid in user_ids), dtype=np.int64, count=len(user_ids))
+        new_xp = old_xp.copy()
+        if imported:
+            positions = np.array([i for i, uid in enumerate(user_ids) if uid in imported], dtype=np.int64)
+            values = np.array([imported[user_ids[i]] for i in positions], dtype=np.int64)
+            new_xp[positions] = np.maximum(new_xp[positions] + values if add else values, 0)
+        new_level = curve.levels_for_xp(new_xp)
+        for i in np.flatnonzero((new_xp != old_xp) | (new_level != old_level)):
+            changes.append((guild_id, user_ids[i], int(old_xp[i]), int(new_xp[i]), int(old_level[i]), int(new_level[i])))
+    return changes
+
+# --- XP Cooldowns ---
+class _Cooldown:
+    __slots__ = ("key", "expires_at")
+    def __init__(self, key: int, expires_at: float):
+        self.key, self.expires_at = key, expires_at
+
+class CooldownTracker:
+    """
+    Tracks which members are on XP cooldown and forgets them once it runs out.
+    Every cooldown has the same length, so records expire in the order they were
+    added and a FIFO queue is enough; memory stays proportional to the members
+    who earned XP within the last `duration` seconds.
+    """
+    __slots__ = ("duration", "active", "expiry_queue", "granted", "suppressed")
+
+    def __init__(self, duration: float = XP_COOLDOWN):
+        self.duration = duration
+        self.active = {}            # packed (guild, user) id -> expiry time
+        self.expiry_queue = deque() # _Cooldown records, oldest first
+        self.granted, self.suppressed = 0, 0
+
+    def __len__(self) -> int:
+        return len(self.active)
+
+    @staticmethod
+    def make_key(guild_id: int, user_id: int) -> int:
+        # Snowflakes fit in 64 bits, so both IDs pack into one int
+        return (guild_id << 64) | user_id
+
+    def expire(self, now: float):
+        while self.expiry_queue and self.expiry_queue[0].expires_at <= now:
+            del self.active[self.expiry_queue.popleft().key]
+
+    def try_acquire(self, guild_id: int, user_id: int, now: float) -> bool:
+        """Starts a cooldown and returns True, or returns False if one is still running."""
+        self.expire(now)
+        key = self.make_key(guild_id, user_id)
+        if key in self.active:
+            self.suppressed += 1
+            return False
+        record = _Cooldown(key, now + self.duration)
+        self.active[key] = record.expires_at
+        self.expiry_queue.append(record)
+        self.granted += 1
+        return True
+
+# --- Level-Up Announcements ---
+class LevelUpAnnouncer:
+    """
+    Coalesces level-up announcements per channel. The first one in a quiet channel
+    is sent right away; any that follow within `window` seconds are buffered and
+    sent together in one message when the window closes or the batch is full.
+    """
+
+    def __init__(self, window: float = LEVELUP_WINDOW, max_batch: int = LEVELUP_MAX_BATCH):
+        self.window, self.max_batch = window, max_batch
+        self.pending = {}   # channel_id -> {member_id: (channel, member, level)}
+        self.timers = {}    # channel_id -> scheduled flush task
+        self.last_sent = {} # channel_id -> loop time of the last announcement
+        self.sending = set() # Send tasks in flight, referenced so they are not garbage-collected
+        self.messages_sent, self.announcements = 0, 0
+
+    def announce(self, channel: discord.abc.Messageable, member: discord.Member, level: int):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.announcements += 1
+        if channel.id not in self.pending and now - self.last_sent.get(channel.id, float('-inf')) >= self.window:
+            self.last_sent[channel.id] = now
+            self._spawn(self._send(channel, [(member, level)]))
+            return
+        batch = self.pending.setdefault(channel.id, {})
+        batch[member.id] = (channel, member, level) # A member levelling twice only needs the latest level
+        if len(batch) >= self.max_batch:
+            self.flush(channel.id)
+        elif channel.id not in self.timers:
+            delay = self.last_sent.get(channel.id, now) + self.window - now
+            self.timers[channel.id] = loop.create_task(self._flush_later(channel.id, max(delay, 0)))
+
+    async def _flush_later(self, channel_id: int, delay: float):
+        await asyncio.sleep(delay)
+        self.timers.pop(channel_id, None)
+        self.flush(channel_id)
+
+    def flush(self, channel_id: int):
+        timer = self.timers.pop(channel_id, None)
+        if timer and timer is not asyncio.current_task(): timer.cancel()
+        batch = self.pending.pop(channel_id, None)
+        if not batch: return
+        entries = list(batch.values())
+        self.last_sent[channel_id] = asyncio.get_running_loop().time()
+        self._spawn(self._send(entries[0][0], [(member, level) for _, member, level in entries]))
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self.sending.add(task)
+        task.add_done_callback(self.sending.discard)
+
+    async def close(self):
+        """Sends whatever is still buffered and waits for every send, e.g. when the cog unloads."""
+        for channel_id in list(self.pending):
+            self.flush(channel_id)
+        await asyncio.gather(*self.sending)
+
+    async def _send(self, channel: discord.abc.Messageable, level_ups: list):
+        if len(level_ups) == 1:
+            member, level = level_ups[0]
+            content = f"🎉 Congratulations {member.mention}, you have reached **Level {level}**!"
+        else:
+            content = "🎉 **Level ups!**\n" + "\n".join(f"{member.mention} reached **Level {level}**" for member, level in level_ups)
+        try:
+            await channel.send(content)
+            self.messages_sent += 1
+        except discord.HTTPException:
+            pass
+
+# --- Leaderboard Index ---
+class _SkipNode:
+    __slots__ = ("key", "next", "width")
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+class LeaderboardIndex:
+    """An indexable skiplist of one guild's users ordered by XP (highest first).
+
+    Every node stores how many entries each of its links skips over, so rank,
+    position lookups, inserts and removals are all O(log n).
+    """
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self.nil = _SkipNode(None, 0)
+        self.head = _SkipNode(None, self.MAX_LEVELS)
+        self.head.next = [self.nil] * self.MAX_LEVELS
+        self.keys = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def make_key(user_id: str, xp: int) -> tuple:
+        return (-xp, int(user_id))
+
+    def _chain(self, key, steps_at_level=None):
+        """Finds the last node before `key` on every level."""
+        chain, node = [None] * self.MAX_LEVELS, self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not self.nil and node.next[level].key < key:
+                if steps_at_level is not None: steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain
+
+    def _insert(self, key):
+        steps_at_level = [0] * self.MAX_LEVELS
+        chain = self._chain(key, steps_at_level)
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5: levels += 1
+        new_node, steps = _SkipNode(key, levels), 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level], prev.next[level] = prev.next[level], new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, key):
+        chain = self._chain(key)
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+    def update(self, user_id: str, xp: int):
+        """Inserts a user or moves them to their new XP position."""
+        key = self.make_key(user_id, xp)
+        old_key = self.keys.get(user_id)
+        if old_key == key: return
+        if old_key is not None: self._remove(old_key)
+        self._insert(key)
+        self.keys[user_id] = key
+
+    def discard(self, user_id: str):
+        key = self.keys.pop(user_id, None)
+        if key is not None: self._remove(key)
+
+    def rank(self, user_id: str) -> int | None:
+        """Returns the 1-based leaderboard position of a user, or None if unranked."""
+        key = self.keys.get(user_id)
+        if key is None: return None
+        position, node = 0, self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not self.nil and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def page(self, start: int, count: int) -> list:
+        """Returns up to `count` (user_id, xp) pairs starting at the 0-based position `start`."""
+        if start < 0 or start >= len(self): return []
+        node, remaining = self.head, start + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not self.nil and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        results = []
+        while node is not self.nil and len(results) < count:
+            neg_xp, user_id = node.key
+            results.append((str(user_id), -neg_xp))
+            node = node.next[0]
+        return results
 
 class Leveling(commands.Cog):
     """Commands for the server's XP and leveling system."""
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.levels_data = load_levels()
-        self.xp_cooldowns = defaultdict(dict)
+        self.store = LevelStore()
+        self.store.import_json()
+        self.levels_data = self.store.load()
+        self.curve = LevelCurve.loads(self.store.get_meta('curve'))
+        self.leaderboards = {} # guild_id -> LeaderboardIndex, built on first use
+        self.xp_cooldowns = CooldownTracker()
+        self.flush_lock = asyncio.Lock()
+        self.announcer = LevelUpAnnouncer()
+        self.flush_levels.start()
+
+    async def cog_unload(self):
+        self.flush_levels.cancel()
+        await self.announcer.close()
+        await self.flush()
+
+    async def flush(self):
+        """Writes all pending XP changes to the database off the event loop."""
+        async with self.flush_lock:
+            rows = self.store.take_batch(self.levels_data)
+            if not rows: return
+            try:
+                await self.bot.loop.run_in_executor(None, self.store.write_batch, rows)
+            except sqlite3.Error as e:
+                print(f"Failed to flush level data: {e}")
+                # Keep the rows pending so the next flush retries them
+                for gid, uid, _, _ in rows: self.store.mark_dirty(gid, uid)
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_levels(self):
+        await self.flush()
+
+    def get_leaderboard(self, guild_id: str) -> LeaderboardIndex:
+        """Returns the guild's leaderboard index, building it from levels_data the first time."""
+        index = self.leaderboards.get(guild_id)
+        if index is None:
+            index = self.leaderboards[guild_id] = LeaderboardIndex()
+            for user_id, data in self.levels_data.get(guild_id, {}).items():
+                if isinstance(data, dict) and data.get('xp', 0) > 0:
+                    index.update(user_id, data['xp'])
+        return index
 
     def get_xp_for_level(self, level: int) -> int:
         """Calculates the total XP needed to reach a certain level."""
-        if level <= 0: return 0
-        return 5 * (level**2) + (50 * level) + 100
+        return self.curve.xp_for_level(level)
+
+    def apply_level_changes(self, changes: list):
+        """Writes the output of recompute_levels back into levels_data and the leaderboards."""
+        for guild_id, user_id, _, new_xp, _, new_level in changes:
+            self.levels_data[guild_id][user_id] = {"xp": new_xp, "level": new_level}
+            self.store.mark_dirty(guild_id, user_id)
+            if guild_id in self.leaderboards:
+                self.leaderboards[guild_id].update(user_id, new_xp)
+
+    def describe_level_changes(self, changes: list, title: str, applied: bool) -> discord.Embed:
+        embed = discord.Embed(title=title, color=discord.Color.green() if applied else discord.Color.orange())
+        guilds = {change[0] for change in changes}
+        embed.description = f"**{len(changes)}** member(s) in **{len(guilds)}** server(s) " + ("were updated." if applied else "would change.")
+        if changes:
+            sample = "\n".join(f"`{uid}`: {old_xp} → {new_xp} XP, Level {old_lvl} → {new_lvl}" for _, uid, old_xp, new_xp, old_lvl, new_lvl in changes[:10])
+            embed.add_field(name="Sample", value=sample, inline=False)
+        if not applied:
+            embed.set_footer(text="Dry run. Add 'apply' to the command to save these changes.")
+        return embed
+
+    # --- Bulk Level Administration ---
+    @commands.group(name="levels", help="Bulk XP/level maintenance. Subcommands: recompute, curve, import", invoke_without_command=True)
+    @commands.is_owner()
+    async def levels(self, ctx: commands.Context):
+        await ctx.reply(f"📈 Current XP curve: `{self.curve}`. Use `{ctx.prefix}levels recompute`, `{ctx.prefix}levels curve` or `{ctx.prefix}levels import`.")
+
+    @levels.command(name="recompute", help="Recomputes every member's level from their XP. Usage: .levels recompute [apply]")
+    @commands.is_owner()
+    async def levels_recompute(self, ctx: commands.Context, mode: str = "dry"):
+        if np is None: return await ctx.reply("❌ NumPy is not installed, so bulk level commands are unavailable.")
+        changes = recompute_levels(self.levels_data, self.curve)
+        applied = mode.lower() == "apply"
+        if applied: self.apply_level_changes(changes)
+        await ctx.reply(embed=self.describe_level_changes(changes, "📈 Level Recompute", applied))
+
+    @levels.command(name="curve", help="Changes the XP curve (a*L² + b*L + c) and recomputes all levels. Usage: .levels curve <a> <b> <c> [apply]")
+    @commands.is_owner()
+    async def levels_curve(self, ctx: commands.Context, a: int, b: int, c: int, mode: str = "dry"):
+        if np is None: return await ctx.reply("❌ NumPy is not installed, so bulk level commands are unavailable.")
+        try:
+            curve = LevelCurve(a, b, c)
+        except ValueError as e:
+            return await ctx.reply(f"❌ {e}")
+        changes = recompute_levels(self.levels_data, curve)
+        applied = mode.lower() == "apply"
+        if applied:
+            self.curve = curve
+            self.store.set_meta('curve', curve.dumps())
+            self.apply_level_changes(changes)
+        await ctx.reply(embed=self.describe_level_changes(changes, f"📈 Curve Change: {curve}", applied))
+
+    @levels.command(name="import", help="Imports XP for this server from an attached JSON file of {user_id: xp}. Usage: .levels import [set|add] [apply]")
+    @commands.is_owner()
+    async def levels_import(self, ctx: commands.Context, how: str = "set", mode: str = "dry"):
+        if np is None: return await ctx.reply("❌ NumPy is not installed, so bulk level commands are unavailable.")
+        if not ctx.message.attachments:
+            return await ctx.reply("❌ Please attach a JSON file mapping user IDs to XP.")
+        try:
+            raw = json.loads(await ctx.message.attachments[0].read())
+            imported = {str(int(uid)): int(xp) for uid, xp in raw.items()}
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+            return await ctx.reply("❌ The attachment must be a JSON object of `{\"user_id\": xp}`.")
+        changes = recompute_levels(self.levels_data, self.curve, {str(ctx.guild.id): imported}, add=how.lower() == "add")
+        applied = mode.lower() == "apply"
+        if applied: self.apply_level_changes(changes)
+        await ctx.reply(embed=self.describe_level_changes(changes, f"📥 XP Import ({len(imported)} entries)", applied))
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -52,15 +506,17 @@ class Leveling(commands.Cog):
         
         # Cooldown check
         now = asyncio.get_event_loop().time()
-        if now < self.xp_cooldowns[guild_id].get(user_id, 0):
+        if not self.xp_cooldowns.try_acquire(message.guild.id, message.author.id, now):
             return
 
         # --- THIS IS THE FIX ---
         # The defaultdict structure now correctly handles creating new users automatically,
         # so the KeyError will no longer occur.
-        self.xp_cooldowns[guild_id][user_id] = now + 60
         xp_to_add = random.randint(15, 25)
         self.levels_data[guild_id][user_id]["xp"] += xp_to_add
+        self.store.mark_dirty(guild_id, user_id) # Persisted by the write-behind flush loop
+        if guild_id in self.leaderboards:
+            self.leaderboards[guild_id].update(user_id, self.levels_data[guild_id][user_id]["xp"])
         
         current_xp = self.levels_data[guild_id][user_id]["xp"]
         current_level = self.levels_data[guild_id][user_id]["level"]
@@ -69,14 +525,7 @@ class Leveling(commands.Cog):
         if current_xp >= xp_for_next_level:
             self.levels_data[guild_id][user_id]["level"] += 1
             new_level = self.levels_data[guild_id][user_id]["level"]
-            try:
-                await message.channel.send(f"🎉 Congratulations {message.author.mention}, you have reached **Level {new_level}**!")
-            except discord.Forbidden:
-                pass
-
-        # Save data periodically
-        if random.randint(1, 5) == 1:
-            save_levels(self.levels_data)
+            self.announcer.announce(message.channel, message.author, new_level)
     
     @commands.command(name="rank", help="Shows your current level and XP.")
     async def rank(self, ctx: commands.Context, member: discord.Member = None):
@@ -101,32 +550,34 @@ class Leveling(commands.Cog):
         embed.set_thumbnail(url=member.display_avatar.url)
         embed.add_field(name="Level", value=f"**{current_level}**", inline=True)
         embed.add_field(name="Total XP", value=f"`{current_xp}`", inline=True)
+        index = self.get_leaderboard(guild_id)
+        position = index.rank(user_id)
+        embed.add_field(name="Rank", value=f"**#{position}** of {len(index)}" if position else "Unranked", inline=True)
         embed.add_field(name="Progress", value=f"`{xp_in_level} / {xp_needed_for_next} XP`\n`[{progress_bar}]`", inline=False)
         
         await ctx.reply(embed=embed)
 
-    @commands.command(name="leaderboard", aliases=['lb'], help="Shows the server's top 10 most active members.")
-    async def leaderboard(self, ctx: commands.Context):
+    @commands.command(name="leaderboard", aliases=['lb'], help="Shows the server's most active members. Usage: .lb [page]")
+    async def leaderboard(self, ctx: commands.Context, page: int = 1):
         guild_id = str(ctx.guild.id)
         if guild_id not in self.levels_data or not self.levels_data[guild_id]:
             return await ctx.reply("There is no leaderboard data for this server yet.")
 
-        # --- THIS IS THE FIX ---
-        # Filter out any potentially malformed entries before sorting
-        valid_users = {uid: data for uid, data in self.levels_data[guild_id].items() if isinstance(data, dict) and 'xp' in data}
-        sorted_users = sorted(valid_users.items(), key=lambda item: item[1]['xp'], reverse=True)
+        index = self.get_leaderboard(guild_id)
+        total_pages = max(1, -(-len(index) // LEADERBOARD_PAGE_SIZE))
+        if not 1 <= page <= total_pages:
+            return await ctx.reply(f"❌ Please choose a page between 1 and {total_pages}.")
+        start = (page - 1) * LEADERBOARD_PAGE_SIZE
 
         embed = discord.Embed(title=f"🏆 XP Leaderboard for {ctx.guild.name}", color=discord.Color.gold())
         
+        rows = index.page(start, LEADERBOARD_PAGE_SIZE)
+        user_names = await self.bot.user_resolver.resolve_names([user_id for user_id, _ in rows], guild=ctx.guild)
+
         description = ""
-        for i, (user_id, data) in enumerate(sorted_users[:10]):
-            try:
-                user = await self.bot.fetch_user(int(user_id))
-                user_name = user.name
-            except discord.NotFound:
-                user_name = "Unknown User"
-            
-            level, xp = data.get('level', 1), data.get('xp', 0)
+        for i, (user_id, xp) in enumerate(rows, start):
+            user_name = user_names[int(user_id)]
+            level = self.levels_data[guild_id][user_id].get('level', 1)
             emoji = ""
             if i == 0: emoji = "🥇"
             elif i == 1: emoji = "🥈"
@@ -138,6 +589,7 @@ class Leveling(commands.Cog):
             return await ctx.reply("There is no one on the leaderboard yet!")
 
         embed.description = description
+        embed.set_footer(text=f"Page {page}/{total_pages} • {len(index)} ranked members")
         await ctx.reply(embed=embed)
 
 
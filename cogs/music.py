@@ -1,11 +1,16 @@
 # cogs/music.py
 import discord
 from discord.ext import commands
-import yt_dlp
 import asyncio
 import os
 import datetime
 import random
+import time
+from collections import deque
+from itertools import islice
+from utils.ytdl_cache import MetadataCache, KEPT_FIELDS, STREAM_EXPIRY_MARGIN
+from utils.ytdl_pool import ExtractionPool
+from utils.audio_cache import AudioCache, AUDIO_CACHE_DIR
 
 # --- yt-dlp and FFmpeg Options ---
 ytdl_format_options = {
@@ -22,30 +27,106 @@ ytdl_format_options = {
     'source_address': '0.0.0.0',
 }
 
-# Simplified, stable FFmpeg options
+# Simplified, stable FFmpeg options. Reconnecting (remote streams only) keeps prefetched sources alive while they wait their turn.
 ffmpeg_options = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn'
 }
 
-ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
-
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
+random_search_options = {'extract_flat': 'in_playlist', 'quiet': True, 'default_search': 'ytsearch10'}
+playlist_options = {'extract_flat': 'in_playlist', 'quiet': True, 'no_warnings': True, 'ignoreerrors': True}
+
+# --- Playback Config ---
+DEFAULT_VOLUME = 0.5       # Volume for a guild until someone uses .volume
+OPUS_PASSTHROUGH = True    # At 100% volume, send Opus streams to Discord as-is instead of decoding and re-encoding them
+FRAME_SECONDS = 0.02       # Audio per frame read by discord.py
+
+# --- Queue Config ---
+PLAYLIST_PAGE = 50         # Playlist entries fetched per flat extraction
+MAX_PLAYLIST_TRACKS = 500  # Entries imported from one playlist
+RESOLVE_AHEAD = 2          # Queue entries after the head resolved in the background
+FLAT_FIELDS = ("id", "url", "title", "duration", "ie_key")
+
+# --- Audio Cache Config ---
+AUDIO_DOWNLOAD_TIMEOUT = 600.0 # Seconds per background download
+AUDIO_DOWNLOAD_QUEUE = 4       # Downloads waiting or running before more are skipped
+audio_download_options = {**ytdl_format_options, 'outtmpl': f'{AUDIO_CACHE_DIR}/%(extractor)s-%(id)s.%(ext)s'}
+
+# Each extraction worker builds its own YoutubeDL per option set. The workers are forked by ytdl_pool.start() in bot.py
+extraction_pool = ExtractionPool({"default": ytdl_format_options, "random_search": random_search_options, "playlist": playlist_options})
+metadata_cache = MetadataCache()
+# Downloads get their own single worker so they never hold up searches. It is a thread: downloads wait on the network and FFmpeg
+download_pool = ExtractionPool({"download": audio_download_options}, workers=1, processes=False, queue_limit=AUDIO_DOWNLOAD_QUEUE, timeout=AUDIO_DOWNLOAD_TIMEOUT)
+audio_cache = AudioCache()
+
+async def extract_info(query: str, loop: asyncio.AbstractEventLoop) -> dict:
+    """Metadata for a URL or search query, extracting only on a cache miss."""
+    data = metadata_cache.get(query) # Repeat plays, replays and loops skip extraction
+    if data is None:
+        data = await loop.run_in_executor(None, metadata_cache.load, query)
+    if data is None:
+        # Only the stream URL expired: extract the known video instead of running the search again
+        resolved = await loop.run_in_executor(None, metadata_cache.resolve, query)
+        info = await extraction_pool.extract(resolved[0] if resolved else query, fields=KEPT_FIELDS)
+        if 'entries' in info:
+            info = info['entries'][0]
+        data = await loop.run_in_executor(None, metadata_cache.store, query, info, resolved[1] if resolved else None)
+    return data
+
+class Track:
+    """
+    One track: its metadata and signed stream URL, carried from the search through the
+    queue to playback. It is re-extracted only once the stream URL expires. Playlist
+    entries start out unresolved (no stream URL) and are resolved near the head of the queue.
+    """
+    __slots__ = ("data", "title", "url", "duration_seconds", "thumbnail", "stream_url", "expires", "pending")
+
+    def __init__(self, data: dict):
+        self._load(data)
+
+    def _load(self, data: dict):
         self.data = data
         self.title = data.get('title')
         self.url = data.get('webpage_url')
         self.duration_seconds = data.get('duration')
         self.thumbnail = data.get('thumbnail')
+        self.stream_url = data.get('url')
+        self.expires = data.get('expires', 0) if self.stream_url else 0
+        self.pending = None # Extraction in progress, shared by everyone waiting on it
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True):
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-        if 'entries' in data:
-            data = data['entries'][0]
-        filename = data['url']
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+    async def resolve(cls, query: str, loop: asyncio.AbstractEventLoop) -> "Track":
+        return cls(await extract_info(query, loop))
+
+    @classmethod
+    def from_flat(cls, entry: dict) -> "Track":
+        """An unresolved track from a flat playlist entry."""
+        url = entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}"
+        return cls({'id': entry.get('id'), 'extractor_key': entry.get('ie_key'), 'title': entry.get('title') or url,
+                    'webpage_url': url, 'duration': entry.get('duration')})
+
+    @property
+    def key(self) -> str | None:
+        """The canonical video ID shared with the metadata and audio caches."""
+        return f"{self.data.get('extractor_key', '')}:{self.data['id']}" if self.data.get('id') else None
+
+    @property
+    def expired(self) -> bool:
+        return self.expires - STREAM_EXPIRY_MARGIN <= time.time()
+
+    async def refresh(self, loop: asyncio.AbstractEventLoop) -> "Track":
+        """Re-extracts the stream URL if it has expired. Returns the track itself."""
+        if not self.expired: return self
+        if self.pending is None:
+            self.pending = asyncio.ensure_future(extract_info(self.url, loop))
+        pending = self.pending
+        try:
+            data = await asyncio.shield(pending) # A cancelled waiter leaves the extraction to the others
+        except Exception:
+            if self.pending is pending: self.pending = None
+            raise
+        if self.pending is pending: self._load(data)
+        return self
 
     @property
     def duration(self) -> str:
@@ -56,31 +137,182 @@ class YTDLSource(discord.PCMVolumeTransformer):
             return f"{hours:02}:{minutes:02}:{seconds:02}" if td.days > 0 or hours > 0 else f"{minutes:02}:{seconds:02}"
         return "N/A"
 
+class TrackQueue:
+    """A guild's upcoming tracks, backed by a deque: O(1) at both ends, O(n) for move/remove/shuffle."""
+
+    def __init__(self):
+        self.tracks = deque()
+
+    def __len__(self): return len(self.tracks)
+    def __iter__(self): return iter(self.tracks)
+
+    def append(self, track: Track): self.tracks.append(track)
+    def extend(self, tracks): self.tracks.extend(tracks)
+    def appendleft(self, track: Track): self.tracks.appendleft(track)
+    def popleft(self) -> Track: return self.tracks.popleft()
+
+    def head(self) -> Track | None:
+        return self.tracks[0] if self.tracks else None
+
+    def peek(self, count: int, start: int = 0) -> list:
+        return list(islice(self.tracks, start, start + count))
+
+    def remove(self, index: int) -> Track:
+        """Removes the track at a 0-based index."""
+        track = self.tracks[index]
+        del self.tracks[index]
+        return track
+
+    def move(self, source: int, destination: int) -> Track:
+        track = self.remove(source)
+        self.tracks.insert(destination, track)
+        return track
+
+    def shuffle(self):
+        tracks = list(self.tracks)
+        random.shuffle(tracks)
+        self.tracks = deque(tracks)
+
+def is_playlist(query: str) -> bool:
+    """Playlist links; a video link that also names a playlist plays just the video (noplaylist)."""
+    return query.startswith(("http://", "https://")) and "list=" in query and "v=" not in query
+
+def ffmpeg_args(source: str, offset: float = 0.0) -> dict:
+    """FFmpeg options for `source`, seeking to `offset` seconds when a track is rebuilt mid-play."""
+    before = ffmpeg_options['before_options'] if source.startswith(("http://", "https://")) else ""
+    if offset: before += f" -ss {offset:.2f}"
+    return {'before_options': before.strip(), 'options': ffmpeg_options['options']}
+
+async def is_opus_stream(track: Track, source: str) -> bool:
+    """Whether the stream is already Opus: from the extracted metadata, or an ffprobe of `source` when it is missing."""
+    codec = track.data.get('acodec')
+    if not codec:
+        try:
+            codec, _ = await discord.FFmpegOpusAudio.probe(source)
+        except Exception:
+            codec = None
+        track.data['acodec'] = codec = codec or "unknown"
+    return codec == "opus"
+
+class TrackSource:
+    """What both playback paths share: the track being played and how far into it playback is."""
+    passthrough = False
+    cached_key = None # Set when playing from the audio cache, which keeps the file until cleanup
+
+    def _attach(self, track: Track, offset: float):
+        self.track, self.data = track, track.data
+        self.title = track.title
+        self.url = track.url
+        self.duration_seconds = track.duration_seconds
+        self.thumbnail = track.thumbnail
+        self.offset, self.frames = offset, 0
+
+    def read(self) -> bytes:
+        data = super().read()
+        if data: self.frames += 1
+        return data
+
+    @property
+    def position(self) -> float:
+        return self.offset + self.frames * FRAME_SECONDS
+
+    def cleanup(self):
+        super().cleanup() # Stops FFmpeg, so the file is closed before it can be evicted
+        key, self.cached_key = self.cached_key, None
+        if key: audio_cache.release(key)
+
+    @property
+    def duration(self) -> str:
+        return self.track.duration
+
+class OpusPassthroughSource(TrackSource, discord.FFmpegOpusAudio):
+    """FFmpeg copies the Opus packets out of the WebM container; nothing is decoded, scaled or re-encoded."""
+    passthrough = True
+    volume = 1.0
+
+    def __init__(self, track: Track, source: str, *, offset: float = 0.0):
+        super().__init__(source, codec="copy", **ffmpeg_args(source, offset))
+        self._attach(track, offset)
+
+class YTDLSource(TrackSource, discord.PCMVolumeTransformer):
+    """The transcoding path: FFmpeg decodes to PCM, the volume is applied per frame and discord.py encodes to Opus."""
+
+    def __init__(self, source, *, track: Track, volume=DEFAULT_VOLUME, offset: float = 0.0):
+        super().__init__(source, volume)
+        self._attach(track, offset)
+
+    @classmethod
+    async def from_track(cls, track: Track, *, loop=None, volume: float = DEFAULT_VOLUME, offset: float = 0.0):
+        """
+        Starts FFmpeg on the track's cached audio file, or on its stream, refreshing the stream
+        URL first only if it expired. At 100% volume an Opus stream gets an OpusPassthroughSource instead.
+        """
+        source = audio_cache.acquire(track.key) if track.key else None
+        cached_key = track.key if source else None
+        try:
+            if source is None:
+                source = (await track.refresh(loop or asyncio.get_event_loop())).stream_url
+            if OPUS_PASSTHROUGH and volume == 1.0 and await is_opus_stream(track, source):
+                player = OpusPassthroughSource(track, source, offset=offset)
+            else:
+                player = cls(discord.FFmpegPCMAudio(source, **ffmpeg_args(source, offset)), track=track, volume=volume, offset=offset)
+        except BaseException: # Including cancellation of a prefetch
+            if cached_key: audio_cache.release(cached_key)
+            raise
+        player.cached_key = cached_key
+        return player
+
+    @classmethod
+    async def from_url(cls, url, *, loop=None):
+        loop = loop or asyncio.get_event_loop()
+        return await cls.from_track(await Track.resolve(url, loop), loop=loop)
+
 class Music(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.guild_states = {}
+        self.tasks = set() # Background tasks, referenced so they are not garbage-collected mid-run
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def cog_load(self):
+        self.spawn(audio_cache.verify_all())
+
+    async def cog_unload(self):
+        extraction_pool.shutdown()
+        download_pool.shutdown()
+        audio_cache.close()
 
     def get_state(self, guild_id: int):
         if guild_id not in self.guild_states:
             self.guild_states[guild_id] = {
-                "queue": [], "now_playing": None, "random_history": [],
-                "loop": False, "previous_song": None
+                "queue": TrackQueue(), "now_playing": None, "random_history": [],
+                "loop": False, "previous_song": None,
+                "prefetch": None, # {"song": queue entry, "task": task building its player}
+                "import_tasks": set(), # Background playlist imports; several can load at once
+                "volume": DEFAULT_VOLUME
             }
         return self.guild_states[guild_id]
 
-    async def play_from_data(self, ctx: commands.Context, song_data: dict):
-        """A robust helper function to play a song from its data dictionary."""
+    async def play_from_data(self, ctx: commands.Context, track: Track):
+        """A robust helper function to play a resolved track."""
         state = self.get_state(ctx.guild.id)
         try:
-            player = await YTDLSource.from_url(song_data["url"], loop=self.bot.loop)
+            player = await self.take_prefetch(state, track) or await YTDLSource.from_track(track, loop=self.bot.loop, volume=state["volume"])
             state["now_playing"] = player
             ctx.voice_client.play(player, after=lambda e: self.play_next_song(ctx))
+            self.prefetch_next(ctx)
+            if track.key and audio_cache.record_play(track.key):
+                self.spawn(self.cache_audio(track))
             embed = discord.Embed(title="🎶 Now Playing", color=discord.Color.green(), description=f"**[{player.title}]({player.url})**")
             embed.set_thumbnail(url=player.thumbnail).set_footer(text=f"Duration: {player.duration}")
             await ctx.send(embed=embed)
         except Exception as e:
-            await ctx.send(f"❌ Error playing `{song_data['title']}`: {e}")
+            await ctx.send(f"❌ Error playing `{track.title}`: {e}")
             self.play_next_song(ctx) # Try next song on error
 
     def play_next_song(self, ctx: commands.Context):
@@ -96,18 +328,98 @@ class Music(commands.Cog):
         if not state["queue"]:
             return
 
-        next_song_data = state["queue"].pop(0)
-        asyncio.run_coroutine_threadsafe(self.play_from_data(ctx, next_song_data), self.bot.loop)
+        next_track = state["queue"].popleft()
+        asyncio.run_coroutine_threadsafe(self.play_from_data(ctx, next_track), self.bot.loop)
+
+    # --- Prefetching ---
+    def prefetch_next(self, ctx: commands.Context):
+        """Resolves the head of the queue and builds its FFmpeg source while the current track plays. Call after any queue change."""
+        state = self.get_state(ctx.guild.id)
+        head = state["queue"].head()
+        for track in state["queue"].peek(RESOLVE_AHEAD, start=1):
+            if track.expired and track.pending is None:
+                self.spawn(self.resolve_quietly(track))
+        if state["prefetch"] and state["prefetch"]["song"] is head: return
+        self.drop_prefetch(state)
+        if head is not None:
+            state["prefetch"] = {"song": head, "task": asyncio.create_task(YTDLSource.from_track(head, loop=self.bot.loop, volume=state["volume"]))}
+
+    async def resolve_quietly(self, track: Track):
+        try:
+            await track.refresh(self.bot.loop)
+        except Exception:
+            pass # Reported when the track reaches the head and is played
+
+    @staticmethod
+    def drop_prefetch(state: dict):
+        """Discards a prefetched track that is no longer next, stopping its idle FFmpeg process."""
+        prefetch, state["prefetch"] = state.get("prefetch"), None
+        if prefetch is None: return
+        task = prefetch["task"]
+        if not task.done(): task.cancel()
+        elif not task.cancelled() and task.exception() is None: task.result().cleanup()
+
+    async def take_prefetch(self, state: dict, track: Track) -> YTDLSource | None:
+        """The prefetched player for `track`, if it is the entry that was prefetched and it resolved."""
+        prefetch = state.get("prefetch")
+        if not prefetch or prefetch["song"] is not track: return None
+        state["prefetch"] = None
+        try:
+            player = await prefetch["task"]
+        except Exception:
+            return None # Fall back to resolving it now
+        if player.passthrough and state["volume"] != 1.0:
+            player.cleanup() # Built at 100% volume, which has changed since
+            return None
+        player.volume = state["volume"] if not player.passthrough else 1.0
+        return player
+
+    async def cache_audio(self, track: Track):
+        """Downloads a frequently played track in the background so later plays use the local file."""
+        audio_cache.downloading.add(track.key)
+        try:
+            info = await download_pool.extract(track.url, options="download", fields=("id", "requested_downloads"), download=True)
+            await audio_cache.store(track.key, info["requested_downloads"][0]["filepath"])
+        except Exception as e:
+            audio_cache.failures += 1
+            print(f"Failed to cache audio for '{track.title}': {e}")
+        finally:
+            audio_cache.downloading.discard(track.key)
 
     async def replay_source(self, ctx: commands.Context, song: YTDLSource):
+        """Restarts `song`: swapped in while audio is still playing (`.replay`), played afresh otherwise (looping)."""
+        state, new_source = self.get_state(ctx.guild.id), None
         try:
-            new_source = await YTDLSource.from_url(song.url, loop=self.bot.loop)
-            if ctx.voice_client.source:
-                new_source.volume = ctx.voice_client.source.volume
-            ctx.voice_client.play(new_source, after=lambda e: self.play_next_song(ctx))
+            new_source = await YTDLSource.from_track(song.track, loop=self.bot.loop, volume=state["volume"])
+            vc = ctx.voice_client
+            if vc.is_playing() or vc.is_paused():
+                self.swap_source(vc, new_source)
+            else:
+                vc.play(new_source, after=lambda e: self.play_next_song(ctx))
+            state["now_playing"] = new_source
         except Exception as e:
+            if new_source is not None: new_source.cleanup() # Stops its FFmpeg and releases a cached file
             await ctx.send(f"❌ Error replaying song: {e}")
 
+    @staticmethod
+    def swap_source(vc: discord.VoiceClient, new_source: TrackSource):
+        """Replaces the playing source without stopping playback, then cleans up the old one."""
+        old_source = vc.source
+        if not new_source.passthrough and not vc.encoder: # MISSING until discord.py starts playback with PCM
+            vc.encoder = discord.opus.Encoder()
+        vc.source = new_source
+        old_source.cleanup()
+
+    async def switch_to_transcoding(self, ctx: commands.Context, source: OpusPassthroughSource):
+        """Swaps a passthrough source for a transcoding one at the same position, so the volume can change mid-track."""
+        state = self.get_state(ctx.guild.id)
+        new_source = await YTDLSource.from_track(source.track, loop=self.bot.loop, volume=state["volume"], offset=source.position)
+        vc = ctx.voice_client
+        if vc is None or vc.source is not source:
+            return new_source.cleanup() # The track ended or changed while FFmpeg was starting
+        self.swap_source(vc, new_source)
+        if state["now_playing"] is source: state["now_playing"] = new_source
+
     async def get_player(self, ctx: commands.Context):
         if not ctx.author.voice:
             await ctx.reply("❌ You must be in a voice channel to use music commands.")
@@ -121,20 +433,65 @@ class Music(commands.Cog):
         if not vc: return
         state, message = self.get_state(ctx.guild.id), None
         if ctx.invoked_with in ['play', 'p']: message = await ctx.reply(f"🔎 Searching for `{query}`...")
+        if is_playlist(query):
+            return await self.import_playlist(ctx, query, message)
         try:
-            player = await YTDLSource.from_url(query, loop=self.bot.loop)
-            # Store serializable data, not the object itself
-            song_data = {"title": player.title, "url": player.url}
+            track = await Track.resolve(query, self.bot.loop) # Resolved once; the queue and playback reuse it
         except Exception as e:
             if message: await message.edit(content=f"❌ An error occurred: {e}")
             else: await ctx.reply(f"❌ An error occurred: {e}")
             return
         if message: await message.delete()
         if vc.is_playing() or state["now_playing"]:
-            state["queue"].append(song_data)
-            await ctx.reply(f"✅ **Added to queue:** {player.title}")
+            state["queue"].append(track)
+            self.prefetch_next(ctx)
+            await ctx.reply(f"✅ **Added to queue:** {track.title}")
         else:
-            await self.play_from_data(ctx, song_data)
+            await self.play_from_data(ctx, track)
+
+    async def import_playlist(self, ctx: commands.Context, url: str, message: discord.Message = None):
+        """Queues a playlist from flat extraction: the first page right away, the rest in the background."""
+        state = self.get_state(ctx.guild.id)
+        try:
+            page = await extraction_pool.extract(url, options="playlist", fields=FLAT_FIELDS,
+                                                 overrides={'playlist_items': f"1-{PLAYLIST_PAGE}"})
+            tracks = [Track.from_flat(entry) for entry in page.get('entries') or []]
+        except Exception as e:
+            tracks, page = [], {"error": e}
+        if not tracks:
+            content = f"❌ Could not load that playlist: {page['error']}" if "error" in page else "❌ That playlist is empty."
+            return await (message.edit(content=content) if message else ctx.reply(content))
+        if message: await message.delete()
+
+        state["queue"].extend(tracks)
+        if not (ctx.voice_client.is_playing() or state["now_playing"]):
+            await self.play_from_data(ctx, state["queue"].popleft())
+        else:
+            self.prefetch_next(ctx)
+        await ctx.reply(f"📃 **Queued {len(tracks)} tracks** from **{page.get('title') or 'the playlist'}**"
+                        + ("; loading the rest in the background..." if len(tracks) == PLAYLIST_PAGE else "."))
+        if len(tracks) == PLAYLIST_PAGE:
+            task = asyncio.create_task(self.import_rest(ctx, url, state))
+            state["import_tasks"].add(task)
+            task.add_done_callback(state["import_tasks"].discard)
+
+    async def import_rest(self, ctx: commands.Context, url: str, state: dict):
+        imported = PLAYLIST_PAGE
+        try:
+            while imported < MAX_PLAYLIST_TRACKS:
+                requested = min(PLAYLIST_PAGE, MAX_PLAYLIST_TRACKS - imported)
+                page = await extraction_pool.extract(url, options="playlist", fields=FLAT_FIELDS,
+                                                     overrides={'playlist_items': f"{imported + 1}-{imported + requested}"})
+                tracks = [Track.from_flat(entry) for entry in page.get('entries') or []]
+                state["queue"].extend(tracks)
+                imported += len(tracks)
+                if tracks and ctx.voice_client and not (ctx.voice_client.is_playing() or state["now_playing"]):
+                    await self.play_from_data(ctx, state["queue"].popleft()) # The queue ran dry while this page loaded
+                else:
+                    self.prefetch_next(ctx)
+                if len(tracks) < requested: break # Reached the end of the playlist
+        except Exception as e:
+            print(f"Playlist import stopped after {imported} tracks: {e}")
 
     # --- FIXED PREVIOUS COMMAND ---
     @commands.command(name="previous", aliases=['prev'], help="Plays the previous song again.")
@@ -148,17 +505,14 @@ class Music(commands.Cog):
         if not previous_song_player:
             return await ctx.reply("❌ There is no previous song in history.")
         
-        # Create serializable data for the songs
-        previous_song_data = {"title": previous_song_player.title, "url": previous_song_player.url}
-        
         # Add the currently playing song back to the start of the queue
         now_playing_player = state.get("now_playing")
         if now_playing_player:
-            now_playing_data = {"title": now_playing_player.title, "url": now_playing_player.url}
-            state["queue"].insert(0, now_playing_data)
+            state["queue"].appendleft(now_playing_player.track)
 
         # Add the previous song to the very front so it plays next
-        state["queue"].insert(0, previous_song_data)
+        state["queue"].appendleft(previous_song_player.track)
+        self.prefetch_next(ctx)
 
         # Skip the current track to immediately trigger the next one
         if vc.is_playing() or vc.is_paused():
@@ -180,8 +534,7 @@ class Music(commands.Cog):
         random_query = random.choice(search_queries)
         try:
             await message.edit(content=f"🔎 Searching for tracks related to: **{random_query}**")
-            with yt_dlp.YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True, 'default_search': 'ytsearch10'}) as ydl:
-                search_results = await self.bot.loop.run_in_executor(None, lambda: ydl.extract_info(random_query, download=False))
+            search_results = await extraction_pool.extract(random_query, options="random_search", fields=("id", "url", "title"))
             if not search_results or not search_results.get('entries'):
                 return await message.edit(content="❌ Could not find any songs for the random search.")
             chosen_song_info = None
@@ -259,11 +612,39 @@ class Music(commands.Cog):
         embed = discord.Embed(title="📜 Song Queue", color=discord.Color.purple())
         embed.description = f"**Now Playing:**\n[{now_playing_player.title}]({now_playing_player.url}) `({now_playing_player.duration})`" if now_playing_player else "Nothing is currently playing."
         if state['queue']:
-            song_list = "\n".join(f"**{i}.** {s['title']}" for i, s in enumerate(state['queue'][:10], 1))
+            song_list = "\n".join(f"**{i}.** {s.title}" for i, s in enumerate(state['queue'].peek(10), 1))
             embed.add_field(name="Up Next", value=song_list, inline=False)
         if len(state['queue']) > 10: embed.set_footer(text=f"And {len(state['queue']) - 10} more...")
         await ctx.reply(embed=embed)
 
+    @commands.command(name="move", help="Moves a song in the queue. Usage: .move <from> <to>")
+    async def move(self, ctx: commands.Context, source: int, destination: int):
+        state = self.get_state(ctx.guild.id)
+        size = len(state["queue"])
+        if not (1 <= source <= size and 1 <= destination <= size):
+            return await ctx.reply(f"❌ Please choose positions between 1 and {size}." if size else "❌ The queue is empty.")
+        track = state["queue"].move(source - 1, destination - 1)
+        self.prefetch_next(ctx)
+        await ctx.reply(f"↕️ Moved **{track.title}** to position **{destination}**.")
+
+    @commands.command(name="remove", help="Removes a song from the queue. Usage: .remove <position>")
+    async def remove(self, ctx: commands.Context, position: int):
+        state = self.get_state(ctx.guild.id)
+        size = len(state["queue"])
+        if not 1 <= position <= size:
+            return await ctx.reply(f"❌ Please choose a position between 1 and {size}." if size else "❌ The queue is empty.")
+        track = state["queue"].remove(position - 1)
+        self.prefetch_next(ctx)
+        await ctx.reply(f"🗑️ Removed **{track.title}** from the queue.")
+
+    @commands.command(name="shuffle", help="Shuffles the queue.")
+    async def shuffle(self, ctx: commands.Context):
+        state = self.get_state(ctx.guild.id)
+        if len(state["queue"]) < 2: return await ctx.reply("❌ There is nothing to shuffle.")
+        state["queue"].shuffle()
+        self.prefetch_next(ctx)
+        await ctx.reply("🔀 Shuffled the queue.")
+
     @commands.command(name="nowplaying", aliases=['np'], help="Shows the currently playing song.")
     async def nowplaying(self, ctx: commands.Context):
         now_playing = self.get_state(ctx.guild.id)["now_playing"]
@@ -276,16 +657,45 @@ class Music(commands.Cog):
     async def volume(self, ctx: commands.Context, value: int):
         if not ctx.voice_client or not ctx.voice_client.source: return await ctx.reply("I am not currently playing anything.")
         if not 0 <= value <= 200: return await ctx.reply("❌ Please enter a value between 0 and 200.")
-        ctx.voice_client.source.volume = value / 100
+        state = self.get_state(ctx.guild.id)
+        state["volume"] = value / 100
+        source = ctx.voice_client.source
+        if getattr(source, "passthrough", False) and value != 100:
+            await self.switch_to_transcoding(ctx, source) # Passthrough cannot scale the audio
+        else:
+            source.volume = state["volume"]
         await ctx.reply(f"✅ Set volume to **{value}%**")
 
     @commands.command(name="stop", aliases=['leave', 'dc'], help="Stops music and disconnects.")
     async def stop(self, ctx: commands.Context):
         if not ctx.voice_client: return await ctx.reply("I am not in a voice channel.")
         state = self.get_state(ctx.guild.id)
+        self.drop_prefetch(state)
+        for task in state.get("import_tasks", ()): task.cancel()
         state.clear()
         self.guild_states.pop(ctx.guild.id, None)
         await ctx.voice_client.disconnect()
         await ctx.reply("👋 Disconnected and cleared queue.")
 
+    @commands.command(name="musicstats", help="Shows music extraction and cache metrics.")
+    @commands.is_owner()
+    async def musicstats(self, ctx: commands.Context):
+        stats = extraction_pool.stats()
+        embed = discord.Embed(title="🎵 Music Extraction", color=discord.Color.purple())
+        embed.add_field(name="Extraction Pool", value=(
+            f"Mode: `{stats['mode']}` | Workers: `{stats['workers']}` | In queue: `{stats['pending']}`\n"
+            f"Completed: `{stats['completed']}` | Failed: `{stats['failed']}` | Timeouts: `{stats['timeouts']}` | "
+            f"Cancelled: `{stats['cancelled']}` | Rejected: `{stats['rejected']}`\n"
+            f"Queue wait: `{stats['wait_p50']:.2f}s` p50 / `{stats['wait_p95']:.2f}s` p95 | "
+            f"Extract time: `{stats['extract_p50']:.2f}s` p50 / `{stats['extract_p95']:.2f}s` p95"
+        ), inline=False)
+        embed.add_field(name="Metadata Cache", value=f"Hits: `{metadata_cache.hits}` | Misses: `{metadata_cache.misses}`", inline=False)
+        cache = audio_cache.stats()
+        embed.add_field(name="Audio Cache", value=(
+            f"Files: `{cache['entries']}` (`{cache['in_use']}` in use) | Size: `{cache['bytes'] / 1024 ** 2:,.1f}` / `{cache['max_bytes'] / 1024 ** 2:,.0f}` MiB\n"
+            f"Hits: `{cache['hits']}` | Misses: `{cache['misses']}` | Downloads: `{cache['downloads']}` (`{cache['downloading']}` running) | "
+            f"Failures: `{cache['failures']}` | Evictions: `{cache['evictions']}` | Corrupt: `{cache['corrupt']}`"
+        ), inline=False)
+        await ctx.reply(embed=embed)
+
 async def setup(bot: commands.Bot): await bot.add_cog(Music(bot))
@@ -57,7 +57,8 @@ class Owner(commands.Cog):
                 return await ctx.reply("The whitelist is currently empty.")
 
             embed = discord.Embed(title="👑 Whitelisted Users", color=discord.Color.blue())
-            user_mentions = [f"- {(self.bot.get_user(uid) or 'Unknown User').mention} (`{uid}`)" for uid in whitelisted_users]
+            users = await self.bot.user_resolver.resolve(whitelisted_users, guild=ctx.guild)
+            user_mentions = [f"- {users[uid].mention if users[uid] else 'Unknown User'} (`{uid}`)" for uid in whitelisted_users]
             embed.description = "\n".join(user_mentions)
             await ctx.reply(embed=embed)
 
@@ -88,6 +89,23 @@ class Owner(commands.Cog):
     async def unwhitelist(self, ctx: commands.Context, user: discord.Member):
         await ctx.invoke(self.whitelist_remove, user=user)
 
+    # --- Diagnostics ---
+    @commands.command(name="aistats", help="Shows Gemini request metrics per cog.")
+    @commands.is_owner()
+    async def aistats(self, ctx: commands.Context):
+        gemini = self.bot.gemini
+        if not gemini.available:
+            return await ctx.reply("❌ The Gemini AI service is not configured.")
+        if not gemini.stats:
+            return await ctx.reply("No Gemini requests have been made yet.")
+        embed = discord.Embed(title="🤖 Gemini Usage", color=discord.Color.blue())
+        for cog_name, stats in gemini.stats.items():
+            embed.add_field(name=cog_name, value=(
+                f"Calls: `{stats.calls}` | Errors: `{stats.errors}` | Retries: `{stats.retries}` | Timeouts: `{stats.timeouts}`\n"
+                f"Avg latency: `{stats.average_latency:.2f}s` | Tokens: `{stats.prompt_tokens}` in / `{stats.output_tokens}` out"
+            ), inline=False)
+        await ctx.reply(embed=embed)
+
     # --- Spam Command Suite ---
     @commands.command(name="spam", help="Spams a user with DMs. Usage: .spam @user <amount>")
     @is_owner_or_whitelisted()
@@ -1,9 +1,15 @@
 # cogs/twentyquestions.py
 import discord
-from discord.ext import commands
-import google.generativeai as genai
-from config import GEMINI_API_KEY
+from discord.ext import commands, tasks
 import asyncio
+import json
+import sqlite3
+import time
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from utils import twentyq_engine
+from utils.twentyq_engine import KnowledgeBase
 
 # --- Translations for UI elements and messages ---
 TRANSLATIONS = {
@@ -19,7 +25,12 @@ TRANSLATIONS = {
         "not_your_game": "This is not your game!",
         "already_running": "A game is already in progress in this channel! Use `.stopq` to end it.",
         "no_game_to_stop": "There is no game in progress to stop.",
-        "permission_denied_stop": "Only {mention} or a moderator can stop this game."
+        "permission_denied_stop": "Only {mention} or a moderator can stop this game.",
+        "correct_message": "🎉 I got it! Thanks for playing.",
+        "teach_title": "What were you thinking of?",
+        "teach_label": "Object",
+        "learned_message": "Thanks! I'll remember **{name}** next time.",
+        "invalid_name": "I can't learn that name. Please use a plain name of up to 60 characters, without mentions."
     },
     "ar": {
         "yes": "نعم",
@@ -33,58 +44,291 @@ TRANSLATIONS = {
         "not_your_game": "هذه ليست لعبتك!",
         "already_running": "هناك لعبة جارية بالفعل في هذه القناة! استخدم `.stopq` لإنهائها.",
         "no_game_to_stop": "لا توجد لعبة جارية لإيقافها.",
-        "permission_denied_stop": "فقط {mention} أو مشرف يمكنه إيقاف هذه اللعبة."
+        "permission_denied_stop": "فقط {mention} أو مشرف يمكنه إيقاف هذه اللعبة.",
+        "correct_message": "🎉 لقد عرفتها! شكرا للعب.",
+        "teach_title": "بماذا كنت تفكر؟",
+        "teach_label": "الشيء",
+        "learned_message": "شكرا! سأتذكر **{name}** في المرة القادمة.",
+        "invalid_name": "لا يمكنني تعلم هذا الاسم. يرجى استخدام اسم بسيط لا يتجاوز 60 حرفا وبدون إشارات."
     }
 }
 
+# --- Game Records ---
+GAMES_DB = "twentyquestions.db"
+GAME_IDLE_TIMEOUT = 300 # Seconds a question waits for an answer before the game times out
+LANGUAGE_NAMES = {"en": "English", "ar": "Arabic"}
+ANSWERS = {"yes": "Yes", "no": "No", "maybe": "Maybe or sometimes", "i_win": "I Win"} # custom_id suffix -> answer
+SPECULATIVE_QUESTIONS = False # Optional: pre-generate the follow-up question for each answer while the player decides (3 requests per question)
+DEFAULT_ENGINE = "local"      # "local" (offline knowledge base) or "ai" (Gemini); `.20q local|ai` overrides it
+LOCAL_MIN_CONFIDENCE = 0.3    # Below this, a local game's final guess is left to Gemini when it is configured
+
+class GameState:
+    """
+    One game, as a small record. `phase` is "thinking" while the bot is generating a
+    question, "awaiting" while the buttons are live and "guessing" while it makes its final guess.
+    Local games also keep the knowledge-base index of each question they asked.
+    """
+    __slots__ = ("channel_id", "author_id", "author_name", "language", "max_questions", "questions_asked", "phase",
+                 "message_id", "last_active", "answers", "engine", "question_ids")
+
+    def __init__(self, channel_id: int, author_id: int, author_name: str, language: str, max_questions: int,
+                 questions_asked: int = 0, phase: str = "thinking", message_id: int = None, last_active: float = None, answers: list = None,
+                 engine: str = "ai", question_ids: list = None):
+        self.channel_id, self.author_id, self.author_name = channel_id, author_id, author_name
+        self.language, self.max_questions, self.questions_asked = language, max_questions, questions_asked
+        self.phase, self.message_id = phase, message_id
+        self.last_active = last_active or time.time()
+        self.answers = answers or [] # [question, answer] pairs; the answer is None while a question is open
+        self.engine, self.question_ids = engine, question_ids or []
+
+    @property
+    def answered(self) -> list:
+        """(question index, answer) pairs for a local game's answered questions."""
+        return [(question, answer) for question, (_, answer) in zip(self.question_ids, self.answers) if answer is not None]
+
+    @property
+    def language_name(self) -> str:
+        return LANGUAGE_NAMES.get(self.language, "English")
+
+    @property
+    def lang_ui(self) -> dict:
+        return TRANSLATIONS.get(self.language, TRANSLATIONS["en"])
+
+    def to_json(self) -> str:
+        return json.dumps({slot: getattr(self, slot) for slot in self.__slots__})
+
+    @classmethod
+    def from_json(cls, raw: str) -> "GameState":
+        data = json.loads(raw)
+        for legacy in ("history", "summary", "summarized"): # Saved by older versions; the game carries on from its answers
+            data.pop(legacy, None)
+        return cls(**data)
+
+# --- Prompts ---
+RECENT_PAIRS = 3            # Latest question/answer pairs sent in full
+SUMMARY_CHARS = 240         # Budget for the encoded summary of the older answers
+SUMMARY_QUESTION_CHARS = 48 # Older questions are cut to this length in the summary
+ANSWER_CODES = {"Yes": "Y", "No": "N", "Maybe or sometimes": "M"}
+
+def build_system_instruction(game: GameState) -> str:
+    """The fixed rules for a game, sent as the system instruction instead of being repeated as a turn."""
+    return (
+        f"20 Questions: guess the object the user thinks of in at most {game.max_questions} questions, strictly in {game.language_name}. "
+        f"Older answers come as notes tagged Y/N/M (yes/no/maybe). "
+        f"Reply with the question only: no other text, translation, or transliteration."
+    )
+
+def encode_summary(pairs: list) -> str:
+    """
+    Older answers in at most SUMMARY_CHARS characters, each question shortened and tagged with
+    its answer code. Once the budget is full the oldest are left out, with a count of how many.
+    """
+    notes, used = [], 0
+    for question, answer in reversed(pairs):
+        question = question.strip().rstrip("?؟").strip()
+        if len(question) > SUMMARY_QUESTION_CHARS: question = question[:SUMMARY_QUESTION_CHARS - 1].rstrip() + "…"
+        note = f"{ANSWER_CODES.get(answer, answer)}: {question}"
+        if used + len(note) + 2 > SUMMARY_CHARS: break
+        notes.append(note)
+        used += len(note) + 2
+    omitted = len(pairs) - len(notes)
+    return "; ".join(reversed(notes)) + (f" (+{omitted} older)" if omitted else "")
+
+def build_request(game: GameState, pending_answer: str = None, final: bool = False) -> list:
+    """
+    One compact user turn: the last RECENT_PAIRS answers in full and the older ones encoded
+    within SUMMARY_CHARS, so the request stops growing after a few questions.
+    `pending_answer` fills in the open question, e.g. to speculate on an answer not given yet.
+    """
+    pairs = [(question, answer if answer is not None else pending_answer) for question, answer in game.answers]
+    pairs = [pair for pair in pairs if pair[1] is not None]
+    older, recent = pairs[:-RECENT_PAIRS], pairs[-RECENT_PAIRS:]
+    lines = "\n".join(f"{i}. {question} -> {answer}" for i, (question, answer) in enumerate(recent, len(older) + 1))
+    if final:
+        task = "Make your final guess: reply with ONLY the name of the object."
+    else:
+        task = f"Ask question {len(pairs) + 1}."
+    summary = f"Older: {encode_summary(older)}\n" if older else ""
+    return [{'role': 'user', 'parts': [f"{summary}Latest:\n{lines or 'None yet.'}\n\n{task}"]}]
+
+def request_size(system_instruction: str, contents: list) -> int:
+    """Bytes of prompt text in a request, for tracking payload size per turn."""
+    return len(system_instruction.encode()) + sum(len(str(part).encode()) for entry in contents for part in entry['parts'])
+
+class GameStore:
+    """Keeps one row per running game in SQLite so games survive restarts. Writes run in order on one background thread."""
+
+    def __init__(self, path: str = GAMES_DB):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="20q-store")
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS games (channel_id INTEGER PRIMARY KEY, state TEXT NOT NULL)")
+
+    def load_all(self) -> list:
+        with closing(sqlite3.connect(self.path)) as conn:
+            rows = conn.execute("SELECT state FROM games").fetchall()
+        games = []
+        for (raw,) in rows:
+            try:
+                games.append(GameState.from_json(raw))
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return games
+
+    def _execute(self, sql: str, params: tuple):
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(sql, params)
+
+    def save(self, game: GameState):
+        self.executor.submit(self._execute, "INSERT INTO games (channel_id, state) VALUES (?, ?) "
+                             "ON CONFLICT (channel_id) DO UPDATE SET state = excluded.state", (game.channel_id, game.to_json()))
+
+    def delete(self, channel_id: int):
+        self.executor.submit(self._execute, "DELETE FROM games WHERE channel_id = ?", (channel_id,))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
 # --- Game View (Buttons) ---
 class TwentyQuestionsView(discord.ui.View):
-    def __init__(self, author, language="en"):
-        super().__init__(timeout=300.0)
-        self.author, self.value = author, None
+    """
+    A persistent view: the buttons have fixed custom_ids and one instance is registered
+    with the bot, so clicks keep working after a restart. Each click is routed to the cog by channel.
+    """
+    def __init__(self, cog: "TwentyQuestions", language="en"):
+        super().__init__(timeout=None)
         lang_ui = TRANSLATIONS.get(language, TRANSLATIONS["en"])
-        self.children[0].label, self.children[1].label, self.children[2].label, self.children[3].label = lang_ui["yes"], lang_ui["no"], lang_ui["maybe"], lang_ui["i_win"]
+        styles = {"yes": discord.ButtonStyle.green, "no": discord.ButtonStyle.red, "maybe": discord.ButtonStyle.blurple, "i_win": discord.ButtonStyle.secondary}
+        for key, style in styles.items():
+            button = discord.ui.Button(label=lang_ui[key], style=style, custom_id=f"20q:{key}", emoji="🏆" if key == "i_win" else None)
+            button.callback = self.make_callback(cog, ANSWERS[key])
+            self.add_item(button)
+
+    @staticmethod
+    def make_callback(cog: "TwentyQuestions", answer: str):
+        async def callback(interaction: discord.Interaction):
+            await cog.handle_answer(interaction, answer)
+        return callback
+
+class TeachModal(discord.ui.Modal):
+    def __init__(self, cog: "TwentyQuestions", game: GameState):
+        lang_ui = game.lang_ui
+        super().__init__(title=lang_ui["teach_title"])
+        self.cog, self.game = cog, game
+        self.name = discord.ui.TextInput(label=lang_ui["teach_label"], max_length=60)
+        self.add_item(self.name)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        name = KnowledgeBase.clean_name(self.name.value)
+        if name is None:
+            return await interaction.response.send_message(self.game.lang_ui["invalid_name"], ephemeral=True)
+        self.cog.learn(self.game, name)
+        await interaction.response.send_message(self.game.lang_ui["learned_message"].format(name=discord.utils.escape_markdown(name)),
+                                                allowed_mentions=discord.AllowedMentions.none())
+
+class TeachView(discord.ui.View):
+    """Asks whether a local game's guess was right, so the knowledge base can learn the game's answers."""
+    def __init__(self, cog: "TwentyQuestions", game: GameState, guess: str):
+        super().__init__(timeout=GAME_IDLE_TIMEOUT)
+        self.cog, self.game, self.guess = cog, game, guess
+        lang_ui = game.lang_ui
+        right = discord.ui.Button(label=lang_ui["yes"], style=discord.ButtonStyle.green)
+        wrong = discord.ui.Button(label=lang_ui["no"], style=discord.ButtonStyle.red)
+        right.callback, wrong.callback = self.right, self.wrong
+        self.add_item(right)
+        self.add_item(wrong)
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.author.id:
-            lang_code = "ar" if "نعم" in self.children[0].label else "en"
-            await interaction.response.send_message(TRANSLATIONS[lang_code]["not_your_game"], ephemeral=True)
+        if interaction.user.id != self.game.author_id:
+            await interaction.response.send_message(self.game.lang_ui["not_your_game"], ephemeral=True)
             return False
         return True
 
-    @discord.ui.button(label="Yes", style=discord.ButtonStyle.green)
-    async def yes(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.value = "Yes"; self.stop()
+    async def right(self, interaction: discord.Interaction):
+        self.stop()
+        self.cog.learn(self.game, self.guess)
+        await interaction.response.edit_message(view=None)
+        await interaction.followup.send(self.game.lang_ui["correct_message"])
 
-    @discord.ui.button(label="No", style=discord.ButtonStyle.red)
-    async def no(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.value = "No"; self.stop()
-    
-    @discord.ui.button(label="Maybe / Sometimes", style=discord.ButtonStyle.blurple)
-    async def maybe(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.value = "Maybe or sometimes"; self.stop()
-
-    @discord.ui.button(label="I Win! (Bot Guesses)", style=discord.ButtonStyle.secondary, emoji="🏆")
-    async def i_win(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.value = "I Win"; self.stop()
+    async def wrong(self, interaction: discord.Interaction):
+        self.stop()
+        await interaction.response.send_modal(TeachModal(self.cog, self.game))
+        await interaction.message.edit(view=None)
 
 class TwentyQuestions(commands.Cog):
-    """A 20 Questions game powered by Gemini AI."""
+    """A 20 Questions game, played offline from a learned knowledge base or with Gemini AI."""
     def __init__(self, bot: commands.Bot):
         self.bot, self.games = bot, {}
-        try:
-            if GEMINI_API_KEY and GEMINI_API_KEY != "YOUR_GEMINI_API_KEY_HERE":
-                genai.configure(api_key=GEMINI_API_KEY)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-            else: self.model = None
-        except Exception as e:
-            print(f"Failed to configure Gemini for 20Q: {e}"); self.model = None
+        self.gemini = bot.gemini
+        self.knowledge = KnowledgeBase() if twentyq_engine.np is not None else None
+        self.store = GameStore()
+        self.speculations = {} # channel_id -> {answer: task generating the question that answer leads to}
+        self.speculation_hits, self.speculation_misses = 0, 0
+        self.request_sizes = deque(maxlen=500) # (questions asked, prompt bytes) per request
+        self.tasks = set() # Background tasks, referenced so they are not garbage-collected mid-run
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def cog_load(self):
+        self.bot.add_view(TwentyQuestionsView(self))
+        for game in self.store.load_all():
+            self.games[game.channel_id] = game
+        self.sweep_games.start()
+        if self.games:
+            self.spawn(self.resume_games())
+
+    async def cog_unload(self):
+        self.sweep_games.cancel()
+        self.store.close()
+
+    async def resume_games(self):
+        """Restarts games that were interrupted mid-request by a restart. Games awaiting an answer need nothing."""
+        await self.bot.wait_until_ready()
+        for game in list(self.games.values()):
+            channel = self.bot.get_channel(game.channel_id)
+            if channel is None:
+                self.finish(game)
+            elif game.phase == "thinking":
+                self.spawn(self.ask_next_question(channel, game))
+            elif game.phase == "guessing":
+                self.spawn(self.end_game(channel, game, with_guess=True))
+
+    @tasks.loop(seconds=60)
+    async def sweep_games(self):
+        """Ends games whose question has gone unanswered, and drops games stuck in any other phase."""
+        now = time.time()
+        for game in list(self.games.values()):
+            idle = now - game.last_active
+            if game.phase == "awaiting" and idle > GAME_IDLE_TIMEOUT:
+                channel = self.bot.get_channel(game.channel_id)
+                self.finish(game)
+                if channel:
+                    try:
+                        await channel.get_partial_message(game.message_id).edit(view=None)
+                        await channel.send(game.lang_ui["timeout_message"])
+                    except discord.HTTPException:
+                        pass
+            elif idle > GAME_IDLE_TIMEOUT * 2:
+                self.finish(game)
+
+    def finish(self, game: GameState):
+        self.cancel_speculations(game.channel_id)
+        if self.games.get(game.channel_id) is game:
+            del self.games[game.channel_id]
+            self.store.delete(game.channel_id)
+        game.phase = "done"
+
+    def transition(self, game: GameState, phase: str):
+        game.phase, game.last_active = phase, time.time()
+        self.store.save(game)
 
     @commands.command(name="20q", help="Starts a game of 20 Questions.")
     async def start_20q(self, ctx: commands.Context, *args):
         """Starts an interactive game, parsing arguments for question count and language."""
-        if not self.model:
-            return await ctx.reply("❌ The Gemini AI service is not configured.")
         if ctx.channel.id in self.games:
             # Determine language for error message if possible
             lang_code_for_error = "en"
@@ -95,6 +339,7 @@ class TwentyQuestions(commands.Cog):
         # Default values
         questions = 20
         lang_code = "en"
+        engine = DEFAULT_ENGINE
         
         # Parse arguments
         for arg in args:
@@ -106,103 +351,169 @@ class TwentyQuestions(commands.Cog):
                     return await ctx.reply("❌ Please choose a number of questions between 3 and 30.")
             elif arg.lower() in TRANSLATIONS:
                 lang_code = arg.lower()
+            elif arg.lower() in ("local", "ai"):
+                engine = arg.lower()
             else:
-                return await ctx.reply(f"❌ Invalid argument `{arg}`. Please provide a number (3-30) or a language (`en`, `ar`).")
+                return await ctx.reply(f"❌ Invalid argument `{arg}`. Please provide a number (3-30), a language (`en`, `ar`) or an engine (`local`, `ai`).")
 
-        language_map = {"en": "English", "ar": "Arabic"}
-        language_name = language_map.get(lang_code, "English")
-        
-        initial_prompt = (
-            f"Let's play a game where you try to guess an object I'm thinking of. You have {questions} questions. "
-            f"You MUST ask all questions and make all guesses strictly in the {language_name} language. "
-            f"Your response MUST ONLY contain the question itself, with no other text, translation, or transliteration. "
-            f"Start with your first question now."
-        )
-
-        self.games[ctx.channel.id] = {
-            "author": ctx.author, "questions_asked": 0, "max_questions": questions,
-            "language": lang_code, "history": [{'role': 'user', 'parts': [initial_prompt]}]
-        }
+        if engine == "local" and self.knowledge is None:
+            engine = "ai" # NumPy is not installed
+        if engine == "ai" and not self.gemini.available:
+            return await ctx.reply("❌ The Gemini AI service is not configured.")
+
+        game = GameState(ctx.channel.id, ctx.author.id, ctx.author.display_name, lang_code, questions, engine=engine)
+        self.games[ctx.channel.id] = game
+        self.store.save(game)
         
-        await ctx.reply(TRANSLATIONS[lang_code]["start_message"])
+        await ctx.reply(game.lang_ui["start_message"])
         await asyncio.sleep(2)
-        await self.ask_next_question(ctx)
+        await self.ask_next_question(ctx.channel, game)
 
-    async def ask_next_question(self, ctx: commands.Context):
-        game_state = self.games.get(ctx.channel.id)
-        if not game_state: return
+    async def generate(self, game: GameState, contents: list, **kwargs):
+        """Sends one turn to Gemini and records its payload size, which levels off once the older answers fill SUMMARY_CHARS."""
+        system_instruction = build_system_instruction(game)
+        self.request_sizes.append((len(game.answers), request_size(system_instruction, contents)))
+        return await self.gemini.generate(contents, cog="TwentyQuestions", system_instruction=system_instruction, **kwargs)
 
-        lang_code = game_state["language"]
-        lang_ui = TRANSLATIONS.get(lang_code, TRANSLATIONS["en"])
+    # --- Speculation ---
+    def speculate(self, game: GameState):
+        """Starts generating the next question for every possible answer while the player decides."""
+        if not SPECULATIVE_QUESTIONS or game.engine == "local" or game.questions_asked >= game.max_questions: return
+        self.cancel_speculations(game.channel_id)
+        self.speculations[game.channel_id] = {
+            answer: asyncio.create_task(self.generate_speculative(game, build_request(game, pending_answer=answer)))
+            for answer in ("Yes", "No", "Maybe or sometimes")
+        }
 
-        if game_state["questions_asked"] >= game_state["max_questions"]:
-            return await self.end_game(ctx, with_guess=True)
+    async def generate_speculative(self, game: GameState, contents: list) -> str | None:
+        try:
+            response = await self.generate(game, contents, speculative=True)
+            return response.text.strip()
+        except Exception:
+            return None # Skipped under load (GeminiBusy) or failed; the answer will be asked for normally
 
-        async with ctx.typing():
-            try:
-                response = await self.model.generate_content_async(game_state["history"])
-                question = response.text.strip()
-                game_state["history"].append({'role': 'model', 'parts': [question]})
-                game_state["questions_asked"] += 1
-                
-                view = TwentyQuestionsView(ctx.author, lang_code)
-                embed = discord.Embed(
-                    title=f"Question {game_state['questions_asked']}/{game_state['max_questions']}",
-                    description=question, color=discord.Color.blue()
-                ).set_footer(text=f"Thinking of an object? Answer for {ctx.author.display_name}")
-                
-                message = await ctx.send(embed=embed, view=view)
-                await view.wait()
-                
-                await message.edit(view=None)
-                
-                if view.value == "I Win": await self.end_game(ctx, with_guess=True)
-                elif view.value:
-                    game_state["history"].append({'role': 'user', 'parts': [f"The answer is: {view.value}"]})
-                    await self.ask_next_question(ctx)
-                else:
-                    await ctx.send(lang_ui["timeout_message"])
-                    if ctx.channel.id in self.games: del self.games[ctx.channel.id]
+    def cancel_speculations(self, channel_id: int, keep: str = None) -> asyncio.Task | None:
+        """Cancels a channel's speculative requests, except the one for `keep`, which is returned."""
+        kept = None
+        for answer, task in self.speculations.pop(channel_id, {}).items():
+            if answer == keep: kept = task
+            else: task.cancel()
+        return kept
 
-            except Exception as e:
-                await ctx.send(f"❌ An error occurred with the Gemini API: {e}")
-                if ctx.channel.id in self.games: del self.games[ctx.channel.id]
+    async def take_speculation(self, task: asyncio.Task) -> str | None:
+        """The question a speculative request produced, or None if it was skipped or failed."""
+        question = await task
+        if question: self.speculation_hits += 1
+        else: self.speculation_misses += 1
+        return question
 
-    async def end_game(self, ctx: commands.Context, with_guess: bool = False):
-        game_state = self.games.get(ctx.channel.id)
-        if not game_state: return
+    async def ask_next_question(self, channel: discord.abc.Messageable, game: GameState, prefetched: asyncio.Task = None):
+        """Generates and posts the next question; the answer buttons drive the following transition."""
+        if game.questions_asked >= game.max_questions:
+            return await self.end_game(channel, game, with_guess=True)
 
-        lang_code, lang_ui = game_state["language"], TRANSLATIONS.get(game_state["language"], TRANSLATIONS["en"])
-        language_map = {"en": "English", "ar": "Arabic"}
-        language_name = language_map.get(lang_code, "English")
+        self.transition(game, "thinking")
+        try:
+            if game.engine == "local":
+                question_id = self.knowledge.next_question(game.answered)
+                if question_id is None: # Every question in the knowledge base has been asked
+                    return await self.end_game(channel, game, with_guess=True)
+                game.question_ids.append(question_id)
+                question = self.knowledge.question(question_id, game.language)
+            else:
+                question = await self.take_speculation(prefetched) if prefetched else None
+            if question is None:
+                async with channel.typing():
+                    response = await self.generate(game, build_request(game))
+                    question = response.text.strip()
+            if game.phase != "thinking": return # Stopped while the question was being generated
+            game.answers.append([question, None])
+            game.questions_asked += 1
+
+            embed = discord.Embed(
+                title=f"Question {game.questions_asked}/{game.max_questions}",
+                description=question, color=discord.Color.blue()
+            ).set_footer(text=f"Thinking of an object? Answer for {game.author_name}")
+            view = TwentyQuestionsView(self, game.language)
+            view.stop() # Only carries the buttons: the instance registered in cog_load handles clicks, and a live one would stay in the view store forever
+            message = await channel.send(embed=embed, view=view)
+            game.message_id = message.id
+            self.transition(game, "awaiting")
+            self.speculate(game)
+        except Exception as e:
+            await channel.send(f"❌ An error occurred with the Gemini API: {e}")
+            self.finish(game)
+
+    async def handle_answer(self, interaction: discord.Interaction, answer: str):
+        """Routes a button click to the game running in its channel."""
+        game = self.games.get(interaction.channel_id)
+        if game is None or game.phase != "awaiting" or interaction.message.id != game.message_id:
+            # A stale question from a finished game, or a second click while the next question is on its way
+            return await interaction.response.edit_message(view=None)
+        if interaction.user.id != game.author_id:
+            return await interaction.response.send_message(game.lang_ui["not_your_game"], ephemeral=True)
+
+        self.transition(game, "thinking") # Before the first await, so a second click is turned away above
+        await interaction.response.edit_message(view=None)
+        prefetched = self.cancel_speculations(game.channel_id, keep=answer)
+        if answer == "I Win":
+            await self.end_game(interaction.channel, game, with_guess=True)
+        else:
+            game.answers[-1][1] = answer
+            await self.ask_next_question(interaction.channel, game, prefetched)
+
+    async def end_game(self, channel: discord.abc.Messageable, game: GameState, with_guess: bool = False):
+        lang_ui = game.lang_ui
 
         if with_guess:
-            async with ctx.typing():
-                final_prompt = (
-                    f"Based on my answers, what is your best guess for what the object is? "
-                    f"Your response MUST be strictly in {language_name} and contain ONLY the name of the object you are guessing, with no other text or translation."
-                )
-                game_state["history"].append({'role': 'user', 'parts': [final_prompt]})
-                response = await self.model.generate_content_async(game_state["history"])
-                await ctx.send(lang_ui["guess_message"].format(guess=response.text.strip(), mention=ctx.author.mention))
+            self.transition(game, "guessing")
+            try:
+                guess, confidence = None, 0.0
+                if game.engine == "local":
+                    best, confidence = self.knowledge.best_guess(game.answered)
+                    guess = self.knowledge.name(best, game.language)
+                if confidence < LOCAL_MIN_CONFIDENCE and self.gemini.available:
+                    async with channel.typing():
+                        response = await self.generate(game, build_request(game, final=True))
+                        guess = response.text.strip()
+                view = TeachView(self, game, guess) if self.knowledge is not None and game.engine == "local" else None
+                # Guesses can be learned names or model output: only the player may be pinged
+                await channel.send(lang_ui["guess_message"].format(guess=guess, mention=f"<@{game.author_id}>"), view=view,
+                                   allowed_mentions=discord.AllowedMentions(everyone=False, roles=False, users=[discord.Object(game.author_id)]))
+            except Exception as e:
+                await channel.send(f"❌ An error occurred with the Gemini API: {e}")
         else:
-            await ctx.send(lang_ui["stop_message"])
+            await channel.send(lang_ui["stop_message"])
 
-        if ctx.channel.id in self.games: del self.games[ctx.channel.id]
+        self.finish(game)
+
+    def learn(self, game: GameState, name: str):
+        """Teaches the knowledge base that a local game's answers describe `name`."""
+        if not name or not game.answered: return
+        try:
+            self.knowledge.learn(name, game.language, game.answered)
+        except ValueError:
+            return # Not a learnable name, e.g. a model-made guess with a mention in it
+        try:
+            self.knowledge.save()
+        except OSError as e:
+            print(f"Failed to save 20 Questions knowledge: {e}")
 
     @commands.command(name="stopq", help="Stops the current game of 20 Questions.")
     async def stop_20q(self, ctx: commands.Context):
         if ctx.channel.id not in self.games:
             return await ctx.reply("There is no game in progress to stop.")
         
-        game_state = self.games[ctx.channel.id]
-        game_author, lang_code = game_state["author"], game_state["language"]
-        lang_ui = TRANSLATIONS.get(lang_code, TRANSLATIONS["en"])
-
-        if ctx.author != game_author and not ctx.author.guild_permissions.manage_messages:
-            return await ctx.reply(lang_ui["permission_denied_stop"].format(mention=game_author.mention))
-            
-        await self.end_game(ctx, with_guess=False)
+        game = self.games[ctx.channel.id]
+        if ctx.author.id != game.author_id and not ctx.author.guild_permissions.manage_messages:
+            return await ctx.reply(game.lang_ui["permission_denied_stop"].format(mention=f"<@{game.author_id}>"))
+
+        if game.phase == "awaiting" and game.message_id:
+            try:
+                await ctx.channel.get_partial_message(game.message_id).edit(view=None)
+            except discord.HTTPException:
+                pass
+        await self.end_game(ctx.channel, game, with_guess=False)
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,166 @@
+# utils/audio_cache.py
+"""
+A size-bounded on-disk cache of audio files for frequently played tracks. The index
+lives in memory in LRU order and is persisted to SQLite; files are checked by size
+on every hit and by SHA-256 when they are stored and on startup.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Cache Config ---
+AUDIO_CACHE_ENABLED = True
+AUDIO_CACHE_DIR = "downloads"
+AUDIO_CACHE_DB = "audio_cache.db"
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3 # Least recently used files are evicted above this
+AUDIO_CACHE_MIN_PLAYS = 3             # Plays before a track is downloaded
+
+def file_digest(path: str) -> tuple[int, str]:
+    """(size, SHA-256) of a file."""
+    digest, size = hashlib.sha256(), 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+class AudioCache:
+    """
+    Keys are canonical video IDs (extractor:id). Lookups and play counts are in memory and
+    cheap enough for the event loop; hashing and database writes run in order on one thread.
+    Files handed out by acquire() are never evicted until release(), which audio threads may call.
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, path: str = AUDIO_CACHE_DB,
+                 max_bytes: int = AUDIO_CACHE_MAX_BYTES, min_plays: int = AUDIO_CACHE_MIN_PLAYS):
+        self.directory, self.path = directory, path
+        self.max_bytes, self.min_plays = max_bytes, min_plays
+        self.entries = OrderedDict() # key -> {"path", "size", "sha256"}, least recently used first
+        self.plays, self.downloading = {}, set()
+        self.in_use, self.lock = {}, threading.Lock() # key -> open players and prefetched sources
+        self.total_bytes = 0
+        self.hits = self.misses = self.downloads = self.failures = self.evictions = self.corrupt = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-cache")
+        os.makedirs(self.directory, exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                         "sha256 TEXT NOT NULL, last_used REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS plays (key TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            files = conn.execute("SELECT key, path, size, sha256 FROM files ORDER BY last_used").fetchall()
+            self.plays = dict(conn.execute("SELECT key, count FROM plays").fetchall())
+        for key, file_path, size, sha256 in files:
+            self.entries[key] = {"path": file_path, "size": size, "sha256": sha256}
+            self.total_bytes += size
+
+    def _execute(self, sql: str, params: tuple):
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            conn.execute(sql, params)
+
+    def _forget(self, key: str):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["size"]
+        self.executor.submit(self._execute, "DELETE FROM files WHERE key = ?", (key,))
+
+    def _drop(self, key: str) -> bool:
+        """Deletes a cached file, then its entry. False if the file could not be deleted (e.g. still open on Windows)."""
+        entry = self.entries.get(key)
+        if entry is None: return True
+        try:
+            os.remove(entry["path"])
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False # Stays indexed, and counted against max_bytes, until a later eviction manages to delete it
+        self._forget(key)
+        return True
+
+    def _busy(self, key: str) -> bool:
+        with self.lock:
+            return key in self.in_use
+
+    # --- Lookups ---
+    def acquire(self, key: str) -> str | None:
+        """
+        The local file for `key`, if it is cached and still has the size it was stored with.
+        The file is marked in use; call release(key) once the player or prefetch using it is done.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            try:
+                intact = os.path.getsize(entry["path"]) == entry["size"]
+            except OSError:
+                intact = False
+            if intact:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                with self.lock:
+                    self.in_use[key] = self.in_use.get(key, 0) + 1
+                self.executor.submit(self._execute, "UPDATE files SET last_used = ? WHERE key = ?", (time.time(), key))
+                return entry["path"]
+            self.corrupt += 1
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def release(self, key: str):
+        with self.lock:
+            count = self.in_use.pop(key, 0) - 1
+            if count > 0: self.in_use[key] = count
+
+    def record_play(self, key: str) -> bool:
+        """Counts a play. Returns True when the track has now been played often enough to download."""
+        count = self.plays[key] = self.plays.get(key, 0) + 1
+        self.executor.submit(self._execute, "INSERT OR REPLACE INTO plays (key, count) VALUES (?, ?)", (key, count))
+        return AUDIO_CACHE_ENABLED and count >= self.min_plays and key not in self.entries and key not in self.downloading
+
+    # --- Storing ---
+    async def store(self, key: str, file_path: str):
+        """Indexes a finished download after hashing it, then evicts down to the size limit."""
+        size, sha256 = await asyncio.get_running_loop().run_in_executor(self.executor, file_digest, file_path)
+        if size == 0:
+            self.failures += 1
+            os.remove(file_path)
+            return
+        stale = self.entries.get(key) # A stale entry for the same track
+        if stale is not None:
+            if stale["path"] == file_path: self._forget(key) # The download replaced it in place
+            elif not self._drop(key):
+                os.remove(file_path) # The old file is still open; keep it rather than track two copies
+                return
+        self.entries[key] = {"path": file_path, "size": size, "sha256": sha256}
+        self.total_bytes += size
+        self.downloads += 1
+        self.executor.submit(self._execute, "INSERT OR REPLACE INTO files (key, path, size, sha256, last_used) VALUES (?, ?, ?, ?, ?)",
+                             (key, file_path, size, sha256, time.time()))
+        for candidate in list(self.entries)[:-1]: # Least recently used first, never the new file
+            if self.total_bytes <= self.max_bytes: break
+            if not self._busy(candidate) and self._drop(candidate):
+                self.evictions += 1
+
+    async def verify_all(self):
+        """Re-hashes every cached file and drops those that changed or disappeared."""
+        loop = asyncio.get_running_loop()
+        for key, entry in list(self.entries.items()):
+            try:
+                size, sha256 = await loop.run_in_executor(self.executor, file_digest, entry["path"])
+            except OSError:
+                size, sha256 = -1, None
+            if (size, sha256) != (entry["size"], entry["sha256"]) and self.entries.get(key) is entry:
+                self.corrupt += 1
+                self._drop(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+            "hits": self.hits, "misses": self.misses, "downloads": self.downloads, "downloading": len(self.downloading), "in_use": len(self.in_use),
+            "failures": self.failures, "evictions": self.evictions, "corrupt": self.corrupt,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,199 @@
+# utils/gemini.py
+import asyncio
+import random
+import time
+from collections import defaultdict
+from config import GEMINI_API_KEY
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+# --- Service Config ---
+MODEL_NAME = 'gemini-1.5-flash'
+RATE_LIMIT = 5.0         # Requests per second, shared by every cog
+RATE_BURST = 10          # Requests allowed back to back before the rate limit applies
+MAX_CONCURRENT = 8       # Requests in flight at once
+MAX_RETRIES = 3          # Retries for rate-limit (429) and server (5xx) errors
+RETRY_BASE_DELAY = 1.0   # Seconds; doubled on every retry, with full jitter
+REQUEST_TIMEOUT = 60.0   # Seconds per attempt
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """A token-bucket rate limiter: `rate` tokens per second, up to `capacity` saved up."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate, self.capacity = rate, capacity
+        self.tokens, self.updated = float(capacity), time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available right now, without waiting."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class CallStats:
+    """Per-cog request accounting."""
+    __slots__ = ("calls", "errors", "retries", "timeouts", "speculations_skipped", "latency_total", "prompt_tokens", "output_tokens")
+
+    def __init__(self):
+        self.calls = self.errors = self.retries = self.timeouts = self.speculations_skipped = 0
+        self.latency_total = 0.0
+        self.prompt_tokens = self.output_tokens = 0
+
+    @property
+    def average_latency(self) -> float:
+        return self.latency_total / self.calls if self.calls else 0.0
+
+    def record_usage(self, usage):
+        if usage is None: return
+        self.prompt_tokens += getattr(usage, 'prompt_token_count', 0) or 0
+        self.output_tokens += getattr(usage, 'candidates_token_count', 0) or 0
+
+class MeteredStream:
+    """Passes a streamed response through and records its token usage, which the last chunk carries, once it ends."""
+
+    def __init__(self, stream, stats: CallStats):
+        self.stream, self.stats = stream, stats
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    async def __aiter__(self):
+        usage = None
+        try:
+            async for chunk in self.stream:
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                yield chunk
+        finally:
+            self.stats.record_usage(usage)
+
+class GeminiBusy(Exception):
+    """Raised for speculative requests when the shared budget has no room for them right now."""
+
+# --- Backends ---
+class GenaiBackend:
+    """Sends requests to Gemini through google-generativeai."""
+
+    def __init__(self, api_key: str, model_name: str = MODEL_NAME):
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.models = {None: genai.GenerativeModel(model_name)} # system instruction -> model
+
+    async def generate(self, contents, *, stream: bool = False, system_instruction: str = None, **kwargs):
+        model = self.models.get(system_instruction)
+        if model is None:
+            model = self.models[system_instruction] = genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+        return await model.generate_content_async(contents, stream=stream, **kwargs)
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+class FakeStream:
+    def __init__(self, text: str, chunk_size: int):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield FakeResponse(chunk)
+
+class FakeBackend:
+    """
+    An offline backend for tests and benchmarks. `reply` is either a fixed string or a
+    callable that receives the request contents and returns the reply text.
+    """
+
+    def __init__(self, reply="This is a canned reply.", *, latency: float = 0.0, chunk_size: int = 16):
+        self.reply, self.latency, self.chunk_size = reply, latency, chunk_size
+        self.requests = []
+
+    async def generate(self, contents, *, stream: bool = False, **kwargs):
+        self.requests.append(contents)
+        if self.latency: await asyncio.sleep(self.latency)
+        text = self.reply(contents) if callable(self.reply) else self.reply
+        return FakeStream(text, self.chunk_size) if stream else FakeResponse(text)
+
+def default_backend():
+    """The real Gemini backend, or None if the library or an API key is missing."""
+    if genai is None or not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
+        print("Gemini API key not found. AI features will be disabled.")
+        return None
+    try:
+        return GenaiBackend(GEMINI_API_KEY)
+    except Exception as e:
+        print(f"Failed to configure Gemini: {e}")
+        return None
+
+# --- Service ---
+class GeminiService:
+    """
+    The bot-wide Gemini client (`bot.gemini`) shared by the Chatbot and 20 Questions cogs.
+    Every request passes through one token-bucket rate limiter and one concurrency cap.
+    Requests that fail with 429/5xx are retried with jittered exponential backoff. Each
+    attempt has a timeout, and latency and token usage are tracked per cog.
+    """
+
+    def __init__(self, backend=None, *, rate: float = RATE_LIMIT, burst: int = RATE_BURST, max_concurrent: int = MAX_CONCURRENT,
+                 max_retries: int = MAX_RETRIES, timeout: float = REQUEST_TIMEOUT):
+        self.backend = backend
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_retries, self.timeout = max_retries, timeout
+        self.stats = defaultdict(CallStats)
+
+    @property
+    def available(self) -> bool:
+        return self.backend is not None
+
+    async def generate(self, contents, *, cog: str, stream: bool = False, timeout: float = None, speculative: bool = False, **kwargs):
+        """
+        Generates a response for `contents`, accounted to `cog`. With `stream=True` the
+        limits cover the request up to the first response, and the caller iterates the stream.
+        Speculative requests never wait or retry: they raise GeminiBusy unless a rate-limit
+        token and a concurrency slot are free right away, so they switch off under load.
+        """
+        if self.backend is None:
+            raise RuntimeError("The Gemini AI service is not configured.")
+        stats = self.stats[cog]
+        if speculative:
+            if self.semaphore.locked() or not self.bucket.try_acquire():
+                stats.speculations_skipped += 1
+                raise GeminiBusy()
+        attempts = 1 if speculative else self.max_retries + 1
+        for attempt in range(attempts):
+            if not speculative: await self.bucket.acquire()
+            async with self.semaphore:
+                started = time.monotonic()
+                try:
+                    response = await asyncio.wait_for(self.backend.generate(contents, stream=stream, **kwargs), timeout or self.timeout)
+                except asyncio.TimeoutError:
+                    stats.timeouts += 1
+                    stats.errors += 1
+                    raise
+                except Exception as e:
+                    if attempt + 1 >= attempts or getattr(e, 'code', None) not in RETRYABLE_CODES:
+                        stats.errors += 1
+                        raise
+                    stats.retries += 1
+                    delay = random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+                else:
+                    stats.calls += 1
+                    stats.latency_total += time.monotonic() - started
+                    if stream: return MeteredStream(response, stats)
+                    stats.record_usage(getattr(response, 'usage_metadata', None))
+                    return response
+            await asyncio.sleep(delay) # Back off outside the semaphore so other requests can run
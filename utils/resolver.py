@@ -0,0 +1,71 @@
+# utils/resolver.py
+import discord
+import asyncio
+import time
+from collections import OrderedDict
+
+class UserResolver:
+    """
+    Resolves user IDs to users for display, shared by every cog through `bot.user_resolver`.
+    Lookup order: guild member cache, the bot's user cache, a TTL'd LRU of earlier
+    REST results, and finally concurrent `fetch_user` calls capped by a semaphore.
+    """
+
+    def __init__(self, bot: discord.Client, *, max_size: int = 5000, ttl: float = 3600.0, concurrency: int = 5):
+        self.bot = bot
+        self.max_size, self.ttl = max_size, ttl
+        self.cache = OrderedDict() # user_id -> (expires_at, user or None)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.hits, self.misses = 0, 0
+
+    def _get_cached(self, user_id: int):
+        """Returns (found, user) from the LRU, dropping the entry if it has expired."""
+        entry = self.cache.get(user_id)
+        if entry is None:
+            return False, None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self.cache[user_id]
+            return False, None
+        self.cache.move_to_end(user_id)
+        return True, user
+
+    def _store(self, user_id: int, user):
+        self.cache[user_id] = (time.monotonic() + self.ttl, user)
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    async def _fetch(self, user_id: int):
+        async with self.semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                user = None # Cached too, so deleted accounts are not fetched again until the TTL runs out
+            except discord.HTTPException:
+                return None
+        self._store(user_id, user)
+        return user
+
+    async def resolve(self, user_ids, guild: discord.Guild = None) -> dict:
+        """Maps each user ID to a Member/User, or None if it could not be found."""
+        results, missing = {}, []
+        for user_id in dict.fromkeys(int(uid) for uid in user_ids):
+            user = (guild.get_member(user_id) if guild else None) or self.bot.get_user(user_id)
+            if user is None:
+                found, user = self._get_cached(user_id)
+                if not found:
+                    missing.append(user_id)
+                    continue
+            self.hits += 1
+            results[user_id] = user
+        if missing:
+            self.misses += len(missing)
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            results.update(zip(missing, fetched))
+        return results
+
+    async def resolve_names(self, user_ids, guild: discord.Guild = None, default: str = "Unknown User") -> dict:
+        """Maps each user ID to a username, using `default` for users that could not be found."""
+        users = await self.resolve(user_ids, guild)
+        return {user_id: user.name if user else default for user_id, user in users.items()}
@@ -0,0 +1,263 @@
+# utils/twentyq_engine.py
+"""
+A local 20 Questions engine. Objects and yes/no attributes form a knowledge matrix; each
+turn asks the question with the highest expected information gain over the remaining
+candidates, and finished games teach it new objects.
+"""
+import json
+import os
+import unicodedata
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # The local engine is disabled without NumPy; games then use Gemini
+
+# --- Engine Config ---
+KNOWLEDGE_FILE = "twentyq_knowledge.json" # Learned knowledge; the seed below is used until it exists
+SEED_WEIGHT = 4.0        # How many observed games a seed fact counts as
+PRIOR_WEIGHT = 1.0       # Pseudo-observations pulling unknown attributes towards 50/50
+ANSWER_NOISE = 0.05      # Chance a player answers a clear-cut question the "wrong" way
+MAYBE_BASE = 0.1         # Chance of "Maybe" for a clear-cut attribute; rises for uncertain ones
+ANSWER_INDEX = {"Yes": 0, "No": 1, "Maybe or sometimes": 2}
+ANSWER_VALUE = (1.0, 0.0, 0.5) # How much each answer counts as a "yes" when learning
+MAX_NAME_CHARS = 60      # Longest object name that can be learned
+
+# --- Seed Knowledge ---
+# key: (English question, Arabic question)
+QUESTIONS = {
+    "alive": ("Is it alive?", "هل هو كائن حي؟"),
+    "animal": ("Is it an animal?", "هل هو حيوان؟"),
+    "plant": ("Is it a plant?", "هل هو نبات؟"),
+    "manmade": ("Is it man-made?", "هل هو من صنع الإنسان؟"),
+    "electric": ("Does it use electricity?", "هل يعمل بالكهرباء؟"),
+    "big": ("Is it bigger than a person?", "هل هو أكبر من الإنسان؟"),
+    "handheld": ("Can you hold it in one hand?", "هل يمكنك حمله بيد واحدة؟"),
+    "edible": ("Can you eat it?", "هل يمكن أكله؟"),
+    "indoors": ("Is it usually found indoors?", "هل يوجد عادة داخل المنزل؟"),
+    "kitchen": ("Is it found in a kitchen?", "هل يوجد في المطبخ؟"),
+    "water": ("Is it found in or near water?", "هل يوجد في الماء أو بالقرب منه؟"),
+    "flies": ("Can it fly?", "هل يستطيع الطيران؟"),
+    "four_legs": ("Does it have four legs?", "هل لديه أربع أرجل؟"),
+    "pet": ("Is it kept as a pet?", "هل يربى كحيوان أليف؟"),
+    "dangerous": ("Is it dangerous?", "هل هو خطير؟"),
+    "vehicle": ("Is it a vehicle?", "هل هو وسيلة نقل؟"),
+    "wheels": ("Does it have wheels?", "هل له عجلات؟"),
+    "metal": ("Is it made mostly of metal?", "هل هو مصنوع في الغالب من المعدن؟"),
+    "wood": ("Is it made of wood?", "هل هو مصنوع من الخشب؟"),
+    "screen": ("Does it have a screen?", "هل له شاشة؟"),
+    "sound": ("Does it make sounds?", "هل يصدر أصواتا؟"),
+    "fruit": ("Is it a fruit?", "هل هو فاكهة؟"),
+    "sweet": ("Does it taste sweet?", "هل طعمه حلو؟"),
+    "furniture": ("Is it furniture?", "هل هو قطعة أثاث؟"),
+    "tool": ("Is it a tool?", "هل هو أداة؟"),
+    "clothing": ("Do you wear it?", "هل يُلبس؟"),
+    "sport": ("Is it used in sports?", "هل يستخدم في الرياضة؟"),
+    "school": ("Is it used at school or in an office?", "هل يستخدم في المدرسة أو المكتب؟"),
+    "round": ("Is it round?", "هل هو دائري الشكل؟"),
+    "fur": ("Does it have fur?", "هل له فرو؟"),
+    "farm": ("Is it found on a farm?", "هل يوجد في المزرعة؟"),
+    "daily": ("Do most people use it every day?", "هل يستخدمه معظم الناس يوميا؟"),
+    "green": ("Is it usually green?", "هل لونه أخضر عادة؟"),
+}
+
+# English name: (Arabic name, attributes that are true; "~" marks "sometimes"). Everything else is false.
+SEED_OBJECTS = {
+    "Dog": ("كلب", "alive animal four_legs pet fur sound ~indoors ~farm ~dangerous"),
+    "Cat": ("قطة", "alive animal four_legs pet fur sound indoors ~handheld"),
+    "Horse": ("حصان", "alive animal four_legs fur farm big ~sound"),
+    "Cow": ("بقرة", "alive animal four_legs farm big sound ~fur"),
+    "Chicken": ("دجاجة", "alive animal farm edible sound ~flies"),
+    "Fish": ("سمكة", "alive animal water edible ~pet ~handheld"),
+    "Shark": ("قرش", "alive animal water dangerous big"),
+    "Eagle": ("نسر", "alive animal flies dangerous"),
+    "Parrot": ("ببغاء", "alive animal flies pet sound ~green ~indoors"),
+    "Snake": ("ثعبان", "alive animal dangerous ~green"),
+    "Lion": ("أسد", "alive animal four_legs fur dangerous big sound"),
+    "Elephant": ("فيل", "alive animal four_legs big sound ~dangerous"),
+    "Rabbit": ("أرنب", "alive animal four_legs fur pet ~farm ~handheld"),
+    "Bee": ("نحلة", "alive animal flies handheld sound ~dangerous ~farm"),
+    "Tree": ("شجرة", "alive plant big green ~farm"),
+    "Rose": ("وردة", "alive plant handheld ~indoors"),
+    "Cactus": ("صبار", "alive plant green ~dangerous ~indoors"),
+    "Apple": ("تفاحة", "edible fruit sweet handheld round kitchen ~green ~plant ~farm"),
+    "Banana": ("موزة", "edible fruit sweet handheld kitchen ~plant ~farm"),
+    "Watermelon": ("بطيخة", "edible fruit sweet round green ~farm ~plant"),
+    "Carrot": ("جزرة", "edible handheld kitchen farm ~plant"),
+    "Bread": ("خبز", "manmade edible kitchen daily ~handheld"),
+    "Pizza": ("بيتزا", "manmade edible round ~kitchen"),
+    "Chocolate": ("شوكولاتة", "manmade edible sweet handheld"),
+    "Car": ("سيارة", "manmade vehicle wheels metal big sound daily ~electric ~dangerous"),
+    "Bicycle": ("دراجة هوائية", "manmade vehicle wheels metal ~sport"),
+    "Airplane": ("طائرة", "manmade vehicle flies metal big sound electric ~wheels"),
+    "Boat": ("قارب", "manmade vehicle water big ~wood ~metal"),
+    "Train": ("قطار", "manmade vehicle wheels metal big electric sound"),
+    "Phone": ("هاتف", "manmade electric handheld screen sound daily"),
+    "Computer": ("حاسوب", "manmade electric screen indoors school ~daily ~sound"),
+    "Television": ("تلفاز", "manmade electric screen indoors sound ~daily"),
+    "Refrigerator": ("ثلاجة", "manmade electric indoors kitchen daily metal ~big"),
+    "Microwave": ("ميكروويف", "manmade electric indoors kitchen metal ~sound"),
+    "Lamp": ("مصباح", "manmade electric indoors daily ~school"),
+    "Chair": ("كرسي", "manmade furniture indoors daily school ~wood"),
+    "Table": ("طاولة", "manmade furniture indoors wood ~kitchen ~school ~daily"),
+    "Bed": ("سرير", "manmade furniture indoors daily ~wood ~big"),
+    "Door": ("باب", "manmade indoors daily big ~wood ~metal"),
+    "Spoon": ("ملعقة", "manmade kitchen metal handheld indoors daily ~tool"),
+    "Knife": ("سكين", "manmade kitchen metal handheld tool indoors dangerous ~daily"),
+    "Hammer": ("مطرقة", "manmade tool metal handheld ~wood ~dangerous"),
+    "Pencil": ("قلم رصاص", "manmade school handheld wood ~tool ~daily"),
+    "Book": ("كتاب", "manmade school handheld indoors"),
+    "Scissors": ("مقص", "manmade tool metal handheld school ~dangerous"),
+    "Shirt": ("قميص", "manmade clothing daily"),
+    "Shoe": ("حذاء", "manmade clothing daily ~sport"),
+    "Hat": ("قبعة", "manmade clothing handheld"),
+    "Football": ("كرة قدم", "manmade sport round handheld"),
+    "Guitar": ("غيتار", "manmade sound wood ~indoors"),
+    "Clock": ("ساعة حائط", "manmade indoors round daily ~electric ~sound ~school"),
+    "Umbrella": ("مظلة", "manmade handheld ~water"),
+    "Sun": ("الشمس", "round big dangerous"),
+    "Moon": ("القمر", "round big"),
+    "Mountain": ("جبل", "big ~green ~dangerous"),
+    "Ocean": ("محيط", "water big dangerous"),
+}
+
+class KnowledgeBase:
+    """
+    Objects x questions, stored as soft "yes" counts over observation counts so seed facts
+    and learned games combine. Candidate probabilities are recomputed from a game's answers
+    with vectorized updates, which takes well under a millisecond for thousands of objects.
+    """
+
+    def __init__(self, path: str = KNOWLEDGE_FILE):
+        self.path = path
+        self.keys = list(QUESTIONS)
+        self.names = [] # one {"en": ..., "ar": ...} per object
+        self.yes = np.zeros((0, len(self.keys)))
+        self.seen = np.zeros((0, len(self.keys)))
+        self._likelihoods = None
+        if not self.load():
+            self.seed()
+
+    def seed(self):
+        yes, seen = [], []
+        for name_en, (name_ar, attributes) in SEED_OBJECTS.items():
+            row = np.zeros(len(self.keys))
+            for attribute in attributes.split():
+                row[self.keys.index(attribute.lstrip("~"))] = 0.5 if attribute.startswith("~") else 1.0
+            yes.append(row * SEED_WEIGHT)
+            seen.append(np.full(len(self.keys), SEED_WEIGHT))
+            self.names.append({"en": name_en, "ar": name_ar})
+        self.yes, self.seen = np.array(yes), np.array(seen)
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                objects = json.load(f)["objects"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Failed to load 20 Questions knowledge, using the seed: {e}")
+            return False
+        # Stored per question key, so questions added to the seed later start out unknown
+        self.names = [entry["names"] for entry in objects]
+        self.yes = np.array([[entry["yes"].get(key, 0.0) for key in self.keys] for entry in objects]).reshape(len(objects), len(self.keys))
+        self.seen = np.array([[entry["seen"].get(key, 0.0) for key in self.keys] for entry in objects]).reshape(len(objects), len(self.keys))
+        return True
+
+    def save(self):
+        objects = [
+            {"names": names, "yes": dict(zip(self.keys, yes.tolist())), "seen": dict(zip(self.keys, seen.tolist()))}
+            for names, yes, seen in zip(self.names, self.yes, self.seen)
+        ]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"objects": objects}, f, ensure_ascii=False)
+
+    # --- Inference ---
+    @property
+    def likelihoods(self) -> "np.ndarray":
+        """P(answer | object, question) as an (objects, questions, 3) array for Yes/No/Maybe."""
+        if self._likelihoods is None:
+            p = (self.yes + PRIOR_WEIGHT * 0.5) / (self.seen + PRIOR_WEIGHT)
+            maybe = MAYBE_BASE + 1.6 * p * (1 - p) # Up to 0.5 for attributes that are a coin flip
+            p = ANSWER_NOISE + (1 - 2 * ANSWER_NOISE) * p
+            self._likelihoods = np.stack(((1 - maybe) * p, (1 - maybe) * (1 - p), maybe), axis=-1)
+        return self._likelihoods
+
+    def posterior(self, pairs: list) -> "np.ndarray":
+        """Candidate probabilities after `pairs` of (question index, answer text)."""
+        log_weights = np.zeros(len(self.names))
+        if pairs:
+            questions = np.array([question for question, _ in pairs])
+            answers = np.array([ANSWER_INDEX[answer] for _, answer in pairs])
+            log_weights += np.log(self.likelihoods[:, questions, answers]).sum(axis=1)
+        weights = np.exp(log_weights - log_weights.max())
+        return weights / weights.sum()
+
+    def next_question(self, pairs: list) -> int | None:
+        """The unasked question with the highest expected information gain, or None if all were asked."""
+        asked = [question for question, _ in pairs]
+        if len(asked) >= len(self.keys):
+            return None
+        weights = self.posterior(pairs)
+        joint = weights[:, None, None] * self.likelihoods  # (objects, questions, answers)
+        answer_probs = joint.sum(axis=0)                   # (questions, answers)
+        posterior = joint / np.maximum(answer_probs, 1e-12)
+        entropy = -(posterior * np.log(np.maximum(posterior, 1e-12))).sum(axis=0)
+        expected = (answer_probs * entropy).sum(axis=1)    # Remaining entropy after each question
+        expected[asked] = np.inf
+        return int(expected.argmin())
+
+    def best_guess(self, pairs: list) -> tuple[int, float]:
+        """The most likely object and its probability."""
+        weights = self.posterior(pairs)
+        best = int(weights.argmax())
+        return best, float(weights[best])
+
+    def question(self, index: int, language: str) -> str:
+        english, arabic = QUESTIONS[self.keys[index]]
+        return arabic if language == "ar" else english
+
+    def name(self, index: int, language: str) -> str:
+        names = self.names[index]
+        return names.get(language) or next(iter(names.values()))
+
+    # --- Learning ---
+    @staticmethod
+    def clean_name(name: str) -> str | None:
+        """
+        A learnable object name with its whitespace collapsed, or None if it is empty, too long,
+        contains control characters or could mention someone ("@"); learned names are shown in every guild.
+        """
+        name = " ".join(name.split())
+        if not name or len(name) > MAX_NAME_CHARS or "@" in name: return None
+        if any(unicodedata.category(char) in ("Cc", "Cs", "Co") or char in "\u202a\u202b\u202c\u202d\u202e\u2066\u2067\u2068\u2069" for char in name):
+            return None # Control, surrogate and private-use characters, and bidi overrides
+        return name
+
+    def find(self, name: str) -> int | None:
+        wanted = name.strip().casefold()
+        for index, names in enumerate(self.names):
+            if any(value.casefold() == wanted for value in names.values()):
+                return index
+        return None
+
+    def learn(self, name: str, language: str, pairs: list) -> bool:
+        """
+        Adds a finished game's answers to `name`, creating the object if it is new. Returns True
+        if it was new. Raises ValueError for a name clean_name() rejects.
+        """
+        cleaned = self.clean_name(name)
+        if cleaned is None:
+            raise ValueError(f"Cannot learn the name {name!r}.")
+        index = self.find(cleaned)
+        created = index is None
+        if created:
+            index = len(self.names)
+            self.names.append({language: cleaned})
+            self.yes = np.vstack((self.yes, np.zeros(len(self.keys))))
+            self.seen = np.vstack((self.seen, np.zeros(len(self.keys))))
+        for question, answer in pairs:
+            self.yes[index, question] += ANSWER_VALUE[ANSWER_INDEX[answer]]
+            self.seen[index, question] += 1
+        self._likelihoods = None
+        return created
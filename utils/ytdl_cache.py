@@ -0,0 +1,130 @@
+# utils/ytdl_cache.py
+"""
+A two-level cache for yt-dlp extraction results: query -> canonical video ID, and video ID ->
+trimmed metadata including the signed stream URL. Both levels live in an in-memory LRU backed
+by SQLite, so repeat plays skip extraction even after a restart, until the stream URL expires.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from urllib.parse import urlparse, parse_qs
+
+# --- Cache Config ---
+METADATA_DB = "music_cache.db"
+MEMORY_ENTRIES = 512           # Videos kept in memory; the query map holds four times as many
+QUERY_TTL = 7 * 24 * 3600      # Seconds a query -> video resolution is trusted
+STREAM_FALLBACK_TTL = 5 * 3600 # Seconds a stream URL is trusted when it carries no expiry
+STREAM_EXPIRY_MARGIN = 600     # Stream URLs this close to expiring count as expired (long tracks need headroom)
+KEPT_FIELDS = ("id", "title", "webpage_url", "duration", "thumbnail", "url", "acodec", "ext", "extractor_key")
+
+def stream_expiry(data: dict) -> float:
+    """When the signed stream URL stops working: its `expire` parameter, or a fallback TTL."""
+    url = data.get("url") or ""
+    expire = parse_qs(urlparse(url).query).get("expire")
+    if not expire and "/expire/" in url: # Manifest URLs carry it as a path segment
+        expire = [url.split("/expire/", 1)[1].split("/", 1)[0]]
+    try:
+        return float(expire[0])
+    except (TypeError, ValueError, IndexError):
+        return time.time() + STREAM_FALLBACK_TTL
+
+def normalize_query(query: str) -> str:
+    query = query.strip()
+    return query if query.startswith(("http://", "https://")) else query.casefold()
+
+class MetadataCache:
+    """Thread-safe: lookups happen on the event loop, stores happen on extraction threads."""
+
+    def __init__(self, path: str = METADATA_DB, max_entries: int = MEMORY_ENTRIES):
+        self.path, self.max_entries = path, max_entries
+        self.videos = OrderedDict()  # video ID -> metadata (with "expires")
+        self.queries = OrderedDict() # normalized query -> (video ID, resolved at)
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS queries (query TEXT PRIMARY KEY, video_id TEXT NOT NULL, resolved_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS videos (video_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("DELETE FROM queries WHERE resolved_at < ?", (time.time() - QUERY_TTL,))
+            conn.execute("DELETE FROM videos WHERE expires < ?", (time.time() - QUERY_TTL,))
+
+    # --- Memory Level ---
+    def _remember(self, query: str, video_id: str, resolved_at: float, data: dict = None):
+        with self.lock:
+            self.queries[query] = (video_id, resolved_at)
+            self.queries.move_to_end(query)
+            while len(self.queries) > self.max_entries * 4:
+                self.queries.popitem(last=False)
+            if data is not None:
+                self.videos[video_id] = data
+                self.videos.move_to_end(video_id)
+                while len(self.videos) > self.max_entries:
+                    self.videos.popitem(last=False)
+
+    def get(self, query: str) -> dict | None:
+        """Memory-only lookup, cheap enough for the event loop. Returns metadata with a usable stream URL."""
+        query = normalize_query(query)
+        with self.lock:
+            resolved = self.queries.get(query)
+            data = self.videos.get(resolved[0]) if resolved and time.time() - resolved[1] < QUERY_TTL else None
+            if data is not None and data["expires"] - STREAM_EXPIRY_MARGIN > time.time():
+                self.queries.move_to_end(query)
+                self.videos.move_to_end(resolved[0])
+                self.hits += 1
+                return data
+        return None
+
+    # --- Disk Level ---
+    def load(self, query: str) -> dict | None:
+        """Looks in memory, then on disk. Blocking; call it from an executor."""
+        data = self.get(query)
+        if data is not None: return data
+        query = normalize_query(query)
+        with closing(sqlite3.connect(self.path)) as conn:
+            row = conn.execute("SELECT v.video_id, v.data, v.expires, q.resolved_at FROM queries q JOIN videos v ON v.video_id = q.video_id "
+                               "WHERE q.query = ?", (query,)).fetchone()
+        if row is None or time.time() - row[3] >= QUERY_TTL or row[2] - STREAM_EXPIRY_MARGIN <= time.time():
+            with self.lock: self.misses += 1
+            return None
+        data = json.loads(row[1])
+        self._remember(query, row[0], row[3], data)
+        with self.lock: self.hits += 1
+        return data
+
+    def resolve(self, query: str) -> tuple[str, float] | None:
+        """
+        (video URL, resolved at) for a query still within QUERY_TTL, even once the stream URL has
+        expired, so the video can be extracted directly instead of searching again. Blocking.
+        """
+        query = normalize_query(query)
+        with self.lock:
+            resolved = self.queries.get(query)
+            data = self.videos.get(resolved[0]) if resolved else None
+        if data is None:
+            with closing(sqlite3.connect(self.path)) as conn:
+                row = conn.execute("SELECT v.data, q.resolved_at FROM queries q JOIN videos v ON v.video_id = q.video_id "
+                                   "WHERE q.query = ?", (query,)).fetchone()
+            if row is None: return None
+            data, resolved = json.loads(row[0]), (None, row[1])
+        if time.time() - resolved[1] >= QUERY_TTL or not data.get("webpage_url"): return None
+        return data["webpage_url"], resolved[1]
+
+    def store(self, query: str, info: dict, resolved_at: float = None) -> dict:
+        """
+        Caches a fresh extraction under its query and its canonical URL. Returns the trimmed metadata.
+        `resolved_at` keeps the query's original age when it was re-extracted through its known video.
+        """
+        data = {field: info[field] for field in KEPT_FIELDS if info.get(field) is not None}
+        data["expires"] = stream_expiry(info)
+        video_id, now = f"{info.get('extractor_key', '')}:{info['id']}", time.time()
+        keys = {normalize_query(query): resolved_at or now}
+        if data.get("webpage_url"): keys[normalize_query(data["webpage_url"])] = now
+        for key, key_resolved_at in keys.items():
+            self._remember(key, video_id, key_resolved_at, data)
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO videos (video_id, data, expires) VALUES (?, ?, ?)", (video_id, json.dumps(data), data["expires"]))
+            conn.executemany("INSERT OR REPLACE INTO queries (query, video_id, resolved_at) VALUES (?, ?, ?)",
+                             [(key, video_id, key_resolved_at) for key, key_resolved_at in keys.items()])
+        return data
@@ -0,0 +1,172 @@
+# utils/ytdl_pool.py
+"""
+A dedicated, size-limited pool for yt-dlp extraction. Jobs run in worker processes forked by
+`start()` before the bot loads its cogs (threads where that was not possible), each worker keeps
+its own YoutubeDL instances, and the pool tracks how long jobs wait in the queue versus how long extraction takes.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import yt_dlp
+
+# --- Pool Config ---
+EXTRACT_WORKERS = 2        # Extractions running at once
+EXTRACT_PROCESSES = True   # Fork worker processes in start() (only where fork is available and the bot has no threads yet; threads otherwise)
+EXTRACT_QUEUE_LIMIT = 16   # Jobs waiting or running before new ones are turned away
+EXTRACT_TIMEOUT = 30.0     # Seconds per job, queue wait included
+METRIC_SAMPLES = 200       # Recent jobs kept for the wait/extract percentiles
+
+class ExtractionBusy(Exception):
+    """Raised when the extraction queue is full."""
+
+# --- Worker Side ---
+_local = threading.local() # YoutubeDL instances per worker thread; they are not thread-safe
+
+def _downloader(name: str, params: dict) -> yt_dlp.YoutubeDL:
+    """The worker's YoutubeDL for an option set. The worker processes are shared by every pool, so the key includes the options."""
+    downloaders = getattr(_local, "downloaders", None)
+    if downloaders is None:
+        downloaders = _local.downloaders = {}
+    key = (name, repr(sorted(params.items())))
+    if key not in downloaders:
+        downloaders[key] = yt_dlp.YoutubeDL(params)
+    return downloaders[key]
+
+def _trim(info: dict, fields: tuple) -> dict:
+    return {field: info[field] for field in fields if field in info}
+
+def _extract(name: str, params: dict, query: str, fields: tuple, download: bool, overrides: dict, submitted: float) -> tuple:
+    """Runs in a worker. Trims the result to `fields` there, so only a small dict crosses the process boundary."""
+    started = time.time()
+    downloader = _downloader(name, params)
+    saved = {key: downloader.params.get(key) for key in overrides}
+    downloader.params.update(overrides) # Per-job options such as playlist_items, undone below
+    try:
+        info = downloader.extract_info(query, download=download)
+    finally:
+        downloader.params.update(saved)
+    if info and fields is not None:
+        entries = info.get('entries')
+        info = _trim(info, fields)
+        if entries is not None:
+            info['entries'] = [_trim(entry, fields) for entry in entries if entry]
+    return info, started - submitted, time.time() - started
+
+def _percentile(samples, pct: float) -> float:
+    if not samples: return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+# --- Worker Processes ---
+_processes = None # Shared ProcessPoolExecutor, set by start()
+
+def start(workers: int = EXTRACT_WORKERS) -> bool:
+    """
+    Forks the extraction worker processes. Call it once before anything starts threads (the bot
+    calls it before loading cogs): forking a threaded process can deadlock the child. Returns
+    whether processes are in use; pools fall back to threads otherwise.
+    """
+    global _processes
+    if _processes is None and EXTRACT_PROCESSES and "fork" in multiprocessing.get_all_start_methods() \
+            and threading.active_count() == 1:
+        # fork, not spawn: spawn would re-import bot.py in every worker
+        _processes = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+        _processes.submit(int) # Forks every worker now, not on first use
+    return _processes is not None
+
+# --- Pool ---
+class ExtractionPool:
+    """
+    `options` maps option set names to yt-dlp options; jobs pick one by name. A job that
+    times out or is cancelled is dropped from the queue if it has not started. One that
+    is already running finishes in the background and still counts towards the queue limit.
+    """
+
+    def __init__(self, options: dict, *, workers: int = EXTRACT_WORKERS, queue_limit: int = EXTRACT_QUEUE_LIMIT,
+                 timeout: float = EXTRACT_TIMEOUT, processes: bool = EXTRACT_PROCESSES):
+        self.options, self.workers = options, workers
+        self.queue_limit, self.timeout = queue_limit, timeout
+        # Pools never fork on their own: they use the workers from start() if it forked them, threads otherwise
+        self.processes = processes and _processes is not None
+        self.executor = self._make_executor()
+        self.pending = 0
+        self.queue_waits, self.extract_times = deque(maxlen=METRIC_SAMPLES), deque(maxlen=METRIC_SAMPLES)
+        self.completed = self.failed = self.timeouts = self.cancelled = self.rejected = 0
+
+    def _make_executor(self):
+        if self.processes:
+            self.workers = _processes._max_workers
+            return _processes
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="ytdl")
+
+    def _replace_broken(self):
+        """A worker died. The bot is threaded by now, so carry on with threads rather than forking again."""
+        global _processes
+        if isinstance(self.executor, ProcessPoolExecutor):
+            if self.executor is _processes:
+                _processes = None
+            self.processes = False
+            self.executor = self._make_executor()
+
+    @property
+    def mode(self) -> str:
+        return "processes" if self.processes else "threads"
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def extract(self, query: str, *, options: str = "default", fields: tuple = None, download: bool = False,
+                      overrides: dict = None, timeout: float = None) -> dict:
+        """
+        Extracts `query` with the named option set, keeping only `fields` (and the same fields of
+        any entries). `overrides` adjusts yt-dlp options for this job only.
+        """
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise ExtractionBusy("The music extractor is busy right now, please try again in a moment.")
+        loop = asyncio.get_running_loop()
+        job = (_extract, options, self.options[options], query, fields, download, overrides or {}) # Options travel with the job, never shared between pools
+        try:
+            future = self.executor.submit(*job, time.time())
+        except BrokenProcessPool:
+            self._replace_broken()
+            future = self.executor.submit(*job, time.time())
+        self.pending += 1
+        future.add_done_callback(lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._release, f))
+        timeout = timeout or self.timeout
+        try:
+            info, waited, took = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"Extraction timed out after {timeout:.0f}s.") from None
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except BrokenProcessPool:
+            self.failed += 1
+            self._replace_broken()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        self.queue_waits.append(waited)
+        self.extract_times.append(took)
+        return info
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode, "workers": self.workers, "pending": self.pending, "completed": self.completed,
+            "failed": self.failed, "timeouts": self.timeouts, "cancelled": self.cancelled, "rejected": self.rejected,
+            "wait_p50": _percentile(self.queue_waits, 50), "wait_p95": _percentile(self.queue_waits, 95),
+            "extract_p50": _percentile(self.extract_times, 50), "extract_p95": _percentile(self.extract_times, 95),
+        }
+
+    def shutdown(self):
+        """Stops this pool's threads. The shared worker processes stay up for the next pool, e.g. after a cog reload."""
+        if self.executor is not _processes:
+            self.executor.shutdown(wait=False, cancel_futures=True)